@@ -39,6 +39,8 @@ bl_info = {
 import bpy
 from bpy.props import BoolProperty
 from bpy.props import EnumProperty
+from bpy.props import FloatProperty
+from bpy.props import IntProperty
 from bpy.props import StringProperty
 
 
@@ -84,8 +86,44 @@ class XSG_Export(bpy.types.Operator) :
 	selected_only: BoolProperty(name="Selection Only", description="Export selected objects only", default=False)
 	seperate: BoolProperty(name="Each in selection to seperate files", description="Export selected objects to seperate files", default=False)
 	export_animation: BoolProperty(name="Export Animation", description="Export animation.", default=False)
+	export_actions_as_sets: BoolProperty(name="Export Actions as Sets", description="Write each object's action as a separate animation, objects without actions sharing a default one", default=False)
+	attach_to_first_armature: BoolProperty(name="Export Unused Actions", description="With actions as sets, also export every action not assigned to an object as an animation of the first armature", default=False)
+	animation_compression: EnumProperty(name="Animation Compression", description="How sampled animation tracks are reduced",
+		items=(('LINEAR', "Keyframe Reduction", "Remove keyframes reproduced by linear/slerp interpolation"), ('CUBIC', "Cubic Curve Fit", "Fit hermite curves to the sampled tracks"),
+		('STREAM', "Streaming Reduction", "Remove keyframes while sampling, keeping memory constant for long timelines")), default='LINEAR')
+	animation_error_mode: EnumProperty(name="Animation Error", description="How keyframe reduction tolerances are chosen",
+		items=(('LOCAL', "Local", "Fixed tolerances for each channel"), ('WORLD', "World Space", "Keep world space bone endpoints within the visual error")), default='LOCAL')
+	animation_visual_error: FloatProperty(name="Visual Error", description="Largest world space displacement allowed by keyframe reduction in World Space error mode", default=0.001, min=0.00001, precision=4)
+	animation_sampling: EnumProperty(name="Animation Sampling", description="Which frames are sampled",
+		items=(('EVERY_FRAME', "Every Frame", "Sample every frame of the scene range"), ('ADAPTIVE', "Adaptive", "Sample every stride frames, refining where motion isn't linear. Simulations must be baked")), default='EVERY_FRAME')
+	animation_sample_stride: IntProperty(name="Sample Stride", description="Frames between the coarse samples of adaptive sampling", default=8, min=2, max=1000)
+	animation_clips: EnumProperty(name="Animation Clips", description="Split the sampled timeline into separate animations",
+		items=(('NONE', "None", "One animation for the frame range"), ('MARKERS', "Timeline Markers", "An animation per timeline marker, running to the next marker. Markers named 'end' or '<clip>.end' only end a clip")), default='NONE')
+	animation_workers: IntProperty(name="Animation Workers", description="Processes used to optimize animation channels in parallel", default=1, min=1, max=64)
+	animation_worker_timeout: FloatProperty(name="Animation Worker Timeout", description="Seconds to wait for the animation workers before optimizing serially instead", default=600.0, min=1.0)
+	export_fcurves: BoolProperty(name="Export F-Curve Keys", description="Write authored location & scale keys as hermite keyframes rather than baked samples where they map exactly", default=False)
+	share_channels: BoolProperty(name="Share Channels", description="Write identical animation channels, such as the bones of instanced characters, once and reference them", default=False)
+	animation_encoding: EnumProperty(name="Animation Encoding", description="How keyframe values are stored",
+		items=(('TEXT', "Text", "Values as text"), ('INLINE', "Quantized Inline", "Smallest three quaternions & 16 bit range quantized vectors, as base64"),
+		('SIDECAR', "Quantized Sidecar", "Smallest three quaternions & 16 bit range quantized vectors, in a binary .anim.bin file")), default='TEXT')
+	share_time_tracks: BoolProperty(name="Share Time Tracks", description="Write identical keyframe time arrays once per animation and reference them by id", default=False)
 	verbose: BoolProperty(name="Verbose",  description="Additional information sent to the console for output", default=False)
 	
+	# Mesh options
+	quantize_attributes: BoolProperty(name="Quantize Attributes", description="Store positions & texture coordinates as 16 bit integers within their bounds and normals octahedral encoded", default=False)
+	quantize_normal_bits: EnumProperty(name="Normal Precision", description="Bits per octahedral normal component when quantizing attributes",
+		items=(('8', "2x8 bit", "Compact, around 1 degree maximum error"), ('16', "2x16 bit", "Precise, well under 0.01 degree maximum error")), default='16')
+	compress_streams: BoolProperty(name="Compress Streams", description="Write index streams delta/edge encoded & vertex attribute streams byte plane filtered, as base64", default=False)
+	skin_max_influences: IntProperty(name="Max Skin Influences", description="Largest number of bones affecting a skinned vertex, keeping the strongest & renormalizing. 0 keeps all", default=0, min=0, max=64)
+	skin_weight_bits: EnumProperty(name="Skin Weight Precision", description="How skin weights are stored",
+		items=(('FLOAT', "Float", "Weights as text floats"), ('16', "16 bit", "Integers summing to 65535 per vertex"), ('8', "8 bit", "Integers summing to 255 per vertex")), default='FLOAT')
+	skin_palette_size: IntProperty(name="Skin Palette Size", description="Split skinned faces into batches using at most this many bones each, for GPU skinning limits. 0 doesn't split", default=0, min=0, max=1024)
+	skinning_layout: EnumProperty(name="Skinning Layout", description="How skin weights are arranged",
+		items=(('INFLUENCE', "Per Influence", "Each influence lists the vertices it affects & their weights"),
+		('VERTEX', "Per Vertex", "Fixed width bone index & weight streams per vertex, as used by GPU vertex attributes")), default='INFLUENCE')
+	export_morphs: BoolProperty(name="Export Shape Keys", description="Write shape keys as sparse morph targets & animate their weights", default=False)
+	morph_threshold: FloatProperty(name="Shape Key Threshold", description="Vertices moved less than this by a shape key are left out of its morph target", default=0.0001, min=0.0, precision=5)
+	
 	def execute(self, context):
 		self.filepath = bpy.path.ensure_ext(self.filepath, ".xsg")
 
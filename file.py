@@ -28,3 +28,31 @@ class File:
 		if self.intentation_level < 0:
 			self.intentation_level = 0
 
+
+
+# Binary file written alongside the text file, holding bulk data the text file references by byte offset & size.
+class Sidecar:
+	def __init__(self, filepath):
+		self.filepath = filepath
+		self.file = None
+		self.offset = 0
+
+	def Open(self):
+		if not self.file:
+			self.file = open(self.filepath, 'wb')
+			self.offset = 0
+
+	def Close(self):
+		self.file.close()
+		self.file = None
+
+	# Append data, aligned to 4 bytes. Returns the offset it was written at.
+	def Write(self, data):
+		padding = -self.offset % 4
+		self.file.write(bytes(padding))
+		self.offset += padding
+
+		offset = self.offset
+		self.file.write(data)
+		self.offset += len(data)
+		return offset
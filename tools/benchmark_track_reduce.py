@@ -0,0 +1,165 @@
+################################################################################################################################
+#
+# Copyright (c) 2023, Advance Software Limited. All rights reserved.
+#
+# Redistribution and use in source and binary forms with or without
+# modification are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL ADVANCE SOFTWARE LIMITED BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# This file : Keyframe reduction benchmark - Track_Reduce against the restart loop Keyframes_Optimize it replaced, on
+#             synthetic bone animation. Pure Python & NumPy, no Blender required.
+#
+#             python tools/benchmark_track_reduce.py [--bones 100] [--frames 10000] [--old-bones 1]
+#
+#             The restart loop is quadratic in track length, so it is timed on --old-bones bones & extrapolated.
+#
+# ------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import sys
+import math
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from xsg_export_animation_track import Track_Reduce
+
+
+SCALE_THRESHOLD = 0.01
+TRANSLATION_THRESHOLD = 0.01
+ROTATION_THRESHOLD = 0.0001
+
+
+# Smooth synthetic motion - per bone (rotations (w, x, y, z), scales, positions), sampled at 30 fps.
+
+def Bones_Generate(bones, frames, seed=0):
+
+	rng = np.random.default_rng(seed)
+	times = np.arange(frames) / 30.0
+	channels = []
+
+	for bone in range(0, bones):
+		frequencies = rng.uniform(0.05, 1.5, (3, 3, 2))
+		phases = rng.uniform(0, 2 * math.pi, (3, 3, 2))
+		waves = np.sin(times[:, np.newaxis, np.newaxis, np.newaxis] * frequencies * 2 * math.pi + phases).sum(axis=3)
+
+		axis = waves[:, 0] / np.linalg.norm(waves[:, 0], axis=1, keepdims=True)
+		angle = waves[:, 1, 0:1] * 0.5
+		rotations = np.concatenate((np.cos(angle / 2), axis * np.sin(angle / 2)), axis=1)
+
+		scales = np.ones((frames, 3)) + (0.05 * waves[:, 2] if bone % 4 == 0 else 0.0)
+		positions = waves[:, 2] * 0.2
+
+		channels.append((rotations, scales, positions))
+
+	return times, channels
+
+
+# The replaced Keyframes_Optimize, with tuples standing in for mathutils vectors & quaternions.
+
+def Slerp_Tuple(q0, q1, alpha):
+	cosine = sum(a * b for a, b in zip(q0, q1))
+	if cosine < 0:
+		q1 = tuple(-b for b in q1)
+		cosine = -cosine
+	if cosine > 0.9995:
+		return tuple(a + (b - a) * alpha for a, b in zip(q0, q1))
+	angle = math.acos(min(cosine, 1.0))
+	sine = math.sin(angle)
+	w0 = math.sin((1 - alpha) * angle) / sine
+	w1 = math.sin(alpha * angle) / sine
+	return tuple(a * w0 + b * w1 for a, b in zip(q0, q1))
+
+
+def Keyframes_Optimize_Restart(times, values, threshold, slerp=False):
+
+	keyframes = list(zip(times.tolist(), [tuple(v) for v in values.tolist()]))
+	done = False
+
+	while not done:
+		done = True
+		count = len(keyframes)
+
+		for index in range(0, count - 2):
+			time_0, key_0 = keyframes[index]
+			time_1, key_1 = keyframes[index + 1]
+			time_2, key_2 = keyframes[index + 2]
+
+			alpha = (time_1 - time_0) / (time_2 - time_0)
+
+			if slerp:
+				interp = Slerp_Tuple(key_0, key_2, alpha)
+				zap = sum((a - b) ** 2 for a, b in zip(interp, key_1)) <= threshold
+			else:
+				interp = tuple(a + (b - a) * alpha for a, b in zip(key_0, key_2))
+				zap = math.sqrt(sum((a - b) ** 2 for a, b in zip(interp, key_1))) <= threshold
+
+			if zap:
+				del keyframes[index + 1]
+				done = False
+				break
+
+	return len(keyframes)
+
+
+def Channels(channels):
+	for rotations, scales, positions in channels:
+		yield rotations, ROTATION_THRESHOLD, True
+		yield scales, SCALE_THRESHOLD, False
+		yield positions, TRANSLATION_THRESHOLD, False
+
+
+def Main():
+
+	parser = argparse.ArgumentParser(description="Keyframe reduction benchmark")
+	parser.add_argument("--bones", type=int, default=100)
+	parser.add_argument("--frames", type=int, default=10000)
+	parser.add_argument("--old-bones", type=int, default=1, help="bones timed with the restart loop, 0 to skip")
+	arguments = parser.parse_args()
+
+	times, channels = Bones_Generate(arguments.bones, arguments.frames)
+	samples = arguments.bones * arguments.frames * 3
+
+	start = time.perf_counter()
+	keys = sum(len(Track_Reduce(times, values, threshold, slerp)) for values, threshold, slerp in Channels(channels))
+	elapsed = time.perf_counter() - start
+
+	print("{} bones x {} frames, {} channel samples".format(arguments.bones, arguments.frames, samples))
+	print("Track_Reduce                : {:.2f}s, {} keys kept".format(elapsed, keys))
+
+	if arguments.old_bones > 0:
+		old_bones = min(arguments.old_bones, arguments.bones)
+
+		start = time.perf_counter()
+		old_keys = sum(Keyframes_Optimize_Restart(times, values, threshold, slerp) for values, threshold, slerp in Channels(channels[0:old_bones]))
+		old_elapsed = time.perf_counter() - start
+
+		new_start = time.perf_counter()
+		new_keys = sum(len(Track_Reduce(times, values, threshold, slerp)) for values, threshold, slerp in Channels(channels[0:old_bones]))
+		new_elapsed = time.perf_counter() - new_start
+
+		print("Restart loop, {} bone(s)     : {:.2f}s, {} keys kept (Track_Reduce : {:.3f}s, {} keys)".format(old_bones, old_elapsed, old_keys, new_elapsed, new_keys))
+		print("Restart loop, extrapolated  : {:.0f}s for {} bones".format(old_elapsed * arguments.bones / old_bones, arguments.bones))
+
+
+if __name__ == "__main__":
+	Main()
@@ -52,6 +52,8 @@ import math
 
 from mathutils import Vector, Matrix
 
+import numpy as np
+
 from .util import Util
 from .file import File
 
@@ -62,7 +64,8 @@ from .xsg_export_material import Export_Material
 from .xsg_export_mesh import Export_Mesh
 #from .xsg_export_mesh_with_duplicated_vertices import Export_Mesh
 
-from .xsg_export_animation import Animation, Keyframe, AnimationGenerator, Animation_Convert_Default, AnimationGenerator_Group, Animation_Convert_Armature, AnimationSet, AnimationWriter, JoinedSetAnimationWriter, SplitSetAnimationWriter
+from .xsg_export_animation_track import Matrices_Parent_Relative, Matrices_Flip_Axis
+from .xsg_export_animation import Animation, AnimationSampler, AnimationOptimizer, AnimationGenerator, Animation_Convert_Default, AnimationGenerator_Group, Animation_Convert_Armature, Animation_Convert_Action, Animation_Convert_Morph, Shape_Keys_Action, AnimationSet, AnimationWriter, JoinedSetAnimationWriter, SplitSetAnimationWriter
 
 
 # Notes :
@@ -87,7 +90,6 @@ class XSG_Export:
 		self.context = context
 
 		config.apply_modifiers = True
-		config.export_actions_as_sets = False
 		config.max_tcoord_channels_to_export = 2
 		
 		self.flip_axis_transform = Util.GetTransform_FlipAxis()
@@ -302,8 +304,14 @@ class XSG_Export:
 		if self.config.export_animation:
 			self.Log("Export_Animation[begin]")
 			
-			# Collect all animated object data
+			# Collect all animated object data, sampling the timeline once for all generators.
+			self.animation_sampler = AnimationSampler(self)
+			self.animation_optimizer = AnimationOptimizer(self)
 			animation_generators = self.Animation_Generators_Gather()
+			self.animation_sampler.Run()
+			
+			# Reduce the sampled keyframes - optionally in parallel.
+			self.animation_optimizer.Run()
 			
 			# Split the data up into animation sets based on user options
 			if self.config.export_actions_as_sets:
@@ -412,14 +420,21 @@ class XSG_Export:
 					generators.append(Animation_Convert_Armature(self, None, obj))
 				else:
 					generators.append(Animation_Convert_Default(self, None, obj))
+					generators.append(Animation_Convert_Morph(self, None, obj))
 		else:
 			# Otherwise, keep track of which objects have no action.  These will be lumped together in a Default_Action AnimationSet.
 			actionless_objects = []
 			
 			for obj in self.export_list:
 			
-				if self.disable_animation:
+				if obj.disable_animation:
 					continue
+					
+				# Shape key actions are sets of their own, holding the mesh's morph weights.
+				shape_keys_action = Shape_Keys_Action(obj.blender_object)
+				
+				if shape_keys_action is not None:
+					generators.append(Animation_Convert_Morph(self, Util.SafeName(shape_keys_action.name), obj))
 			
 				if obj.blender_object.animation_data is None:
 					actionless_objects.append(obj)
@@ -445,37 +460,21 @@ class XSG_Export:
 						break
 					
 				if first_armature is not None:
-					# Determine which actions are not used
+					# Determine which actions are not used. Only actions keying pose bones can apply to the armature.
 					used_actions = [blender_object.animation_data.action
 						for blender_object in bpy.data.objects
 						if blender_object.animation_data is not None]
 					free_actions = [action for action in bpy.data.actions
-						if action not in used_actions]
+						if action not in used_actions and any(fcurve.data_path.startswith('pose.bones[') for fcurve in action.fcurves)]
 					
 					# If the first armature has no action, remove it from the actionless objects so it doesn't end up in Default_Action
 					if first_armature in actionless_objects and len(free_actions):
 						actionless_objects.remove(first_armature)
 					
-					# Keep track of the first armature's animation data so we can restore it after export
-					prev_action = None
-					no_data = False
-					if first_armature.blender_object.animation_data is not None:
-						prev_action = first_armature.blender_object.animation_data.action
-					else:
-						no_data = True
-						first_armature.blender_object.animation_data_create()
-					
-					# Build a generator for each unused action
+					# Build a generator for each unused action, evaluating its F-curves directly so the armature's action needn't
+					# be reassigned & the scene stepped through for each.
 					for action in free_actions:
-						first_armature.blender_object.animation_data.action = action
-						
-						Generators.append(AnimationGenerator_Armature(self, Util.SafeName(Action.name), first_armature))
-					
-					# Restore old animation data
-					first_armature.blender_object.animation_data.action = prev_action
-						
-					if no_data:
-						first_armature.blender_object.animation_data_clear()
+						generators.append(Animation_Convert_Action(self, Util.SafeName(action.name), first_armature, action))
 			
 			# Build a special generator for all actionless objects
 			if len(actionless_objects):
@@ -668,42 +667,73 @@ class Export_Skin(Export_Base):
 		return "[Export_Skin: {}]".format(self.name)
 	
 	def Write(self, flags):
-		blender_armature = self.blender_object
 		t = self.exporter.Transform_Convert(self.blender_object.matrix_local)
 		self.Write_Node_Begin(self.name, t)
-		root_bones = [bone for bone in blender_armature.data.bones if bone.parent is None]  # pose.bones then accessed from Bones as required.
-		self.Influences_Write(root_bones)
+		self.Bone_Table_Build()
+		self.Influences_Write()
 		self.Write_Node_End()
 		self.Write_Children(flags)
 	
-	def Influences_Write(self, influences):
+	def Bone_Table_Build(self):
+	
+		# Index the armature's bones once : ids, parent indices, a depth first order (roots in armature order, children
+		# by name) with each bone's depth, and all influence to parent transforms evaluated in one batch.
 		
-		# Export a node for each influence (blender pose bone)
+		pose_bones = self.blender_object.pose.bones
+		bone_count = len(pose_bones)
 		
-		for influence in influences:
-			
-			t = Matrix()
-			
-			pose_bone = self.blender_object.pose.bones[influence.name]
-			
-			if influence.parent:
-				t = pose_bone.parent.matrix.inverted()
-			
-			t @= pose_bone.matrix
-			
-			influence_to_parent = t
-
-			influence_id = Util.SafeName(influence.name)
+		names = [pose_bone.name for pose_bone in pose_bones]
+		bone_index = {name : index for index, name in enumerate(names)}
+		
+		self.bone_ids = [Util.SafeName(name) for name in names]
+		self.bone_parents = np.array([bone_index[pose_bone.parent.name] if pose_bone.parent else -1 for pose_bone in pose_bones], dtype=np.int64)
+		
+		children = [[] for index in range(0, bone_count)]
+		
+		for index in sorted(range(0, bone_count), key=names.__getitem__):
+			if self.bone_parents[index] >= 0:
+				children[self.bone_parents[index]].append(index)
+		
+		# Depth first traversal with an explicit stack, as bone chains (hair, cloth) can outgrow the recursion limit.
+		self.bone_order = []
+		self.bone_depths = np.zeros(bone_count, dtype=np.int64)
+		stack = [index for index in reversed(range(0, bone_count)) if self.bone_parents[index] < 0]
+		
+		while stack:
+			index = stack.pop()
+			self.bone_order.append(index)
 			
-			t = self.exporter.Transform_Convert(influence_to_parent)
-			self.Write_Node_Begin(influence_id, t)
-
+			for child in reversed(children[index]):
+				self.bone_depths[child] = self.bone_depths[index] + 1
+				stack.append(child)
+		
+		# Blender stores matrices column major.
+		matrices = np.empty(bone_count * 16, dtype=np.float32)
+		pose_bones.foreach_get("matrix", matrices)
+		matrices = matrices.reshape(-1, 4, 4).transpose(0, 2, 1)
+		
+		self.bone_matrices = Matrices_Flip_Axis(Matrices_Parent_Relative(matrices, self.bone_parents))
+	
+	def Influences_Write(self):
+		
+		# Export a node for each influence (blender pose bone), nested per the bone table's depth first order.
+		
+		open_nodes = 0
+		
+		for index in self.bone_order:
+		
+			while open_nodes > self.bone_depths[index]:
+				self.Influence_Write_End()
+				open_nodes -= 1
+		
+			self.Write_Node_Begin(self.bone_ids[index], self.bone_matrices[index])
 			self.exporter.file.Indent()
-			
-			self.Influence_Write_Children(influence)
-			self.exporter.file.Unindent()
-			
-			self.Write_Node_End()
+			open_nodes += 1
+		
+		while open_nodes > 0:
+			self.Influence_Write_End()
+			open_nodes -= 1
 	
-	def Influence_Write_Children(self, inf):
-		self.Influences_Write(Util.SortByNameField(inf.children))
+	def Influence_Write_End(self):
+		self.exporter.file.Unindent()
+		self.Write_Node_End()
@@ -28,87 +28,523 @@
 # ------------------------------------------------------------------------------------------------------------------------------
 
 import bpy
-from mathutils import Vector, Matrix
+import os
+import sys
+import importlib
+import multiprocessing
+import base64
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from .util import Util
+from .file import Sidecar
+from .xsg_export_quantize import Quantize_Range, Quaternion_Smallest_Three_Encode
+from .xsg_export_animation_track import Track, Track_Stream, Quaternions_Continuous, Quaternions_To_Matrices, Eulers_To_Matrices, Matrices_Compose, Matrices_Decompose, Matrices_Flip_Axis, Matrices_Adjust_Projector, Matrices_Parent_Relative, Matrices_World, Hierarchy_Order, Track_Evaluate, Track_Slice, Track_Optimize, FCurve_Evaluate
 
-class Keyframe:
-	def __init__(self, time, value):
-		self.time = time
-		self.value = value		
+# Evaluate an F-curve at each of frames without changing the scene frame.
+def FCurve_Values(fcurve, frames):
+
+	values = None
+	
+	if len(fcurve.modifiers) == 0:
+		points = fcurve.keyframe_points
+		count = len(points)
+		
+		co = np.empty(count * 2)
+		handle_left = np.empty(count * 2)
+		handle_right = np.empty(count * 2)
+		
+		points.foreach_get("co", co)
+		points.foreach_get("handle_left", handle_left)
+		points.foreach_get("handle_right", handle_right)
 		
+		values = FCurve_Evaluate(frames, co, handle_left, handle_right, [point.interpolation for point in points], fcurve.extrapolation)
+		
+	# Easing modes & F-curve modifiers are left to Blender.
+	if values is None:
+		values = np.array([fcurve.evaluate(frame) for frame in frames])
+		
+	return values
+	
+
+# Keyframe tracks for one animation target. Rotations are stored as (w, x, y, z) quaternions.
+# Sampled animations can be streamed, reducing keyframes as samples arrive rather than once all have been recorded.
 class Animation:
-	def __init__(self, id):
+
+	# TODO: Add these as configuration parameters if required.
+	scale_threshold = 0.01
+	translation_threshold = 0.01
+	rotation_threshold = 0.0001
+	
+	# What the animation's channel drives.
+	target = "node"
+	
+	def __init__(self, id, capacity=0, stream=False):
 		self.name = id
 		
-		self.keyframes_rotation = []
-		self.keyframes_scale = []
-		self.keyframes_position = []
+		self.keyframes_rotation = Track(4, capacity)
+		self.keyframes_scale = Track(3, capacity)
+		self.keyframes_position = Track(3, capacity)
+		
+		self.stream = stream
+		self.streams = None
+		self.sample_count = 0
+		
+	# (dest, track) of each keyframes element the animation's channel can hold, in write order.
+	def Channel_Tracks(self):
+		return [("rotation", self.keyframes_rotation), ("scale", self.keyframes_scale), ("position", self.keyframes_position)]
+		
+	# Thresholds keeping the displacement of points within reach of the animation's origin below error. Rotation thresholds
+	# are squared quaternion distances - |q0 - q1|^2 = 2 - 2 cos(angle / 2) for rotations angle apart.
+	def Tolerance_Set(self, error, reach):
+	
+		reach = max(reach, error)
+		angle = min(error / reach, 1.0)
+		
+		self.translation_threshold = error
+		self.scale_threshold = error / reach
+		self.rotation_threshold = 2.0 - 2.0 * np.cos(angle / 2)
+		
+	def Tolerance_Scale(self, factor):
+		self.translation_threshold *= factor
+		self.scale_threshold *= factor
+		self.rotation_threshold *= factor * factor
+		
+	# Replace the tracks with the given samples, to be optimized again.
+	def Samples_Restore(self, times, rotations, scales, positions):
+		self.keyframes_rotation = Track(4, len(times))
+		self.keyframes_scale = Track(3, len(times))
+		self.keyframes_position = Track(3, len(times))
+		
+		self.keyframes_rotation.Append_Block(times, rotations)
+		self.keyframes_scale.Append_Block(times, scales)
+		self.keyframes_position.Append_Block(times, positions)
+		
+	# Per component tolerance of a sampled (rotation, scale, position) state, for adaptive sampling.
+	def Sample_Tolerance(self):
+		rotation = np.sqrt(self.rotation_threshold)
+		return np.array((rotation,) * 4 + (self.scale_threshold,) * 3 + (self.translation_threshold,) * 3)
+		
+	# Record the sampled transform at time. Rotation is a (w, x, y, z) quaternion.
+	def Sample_Append(self, time, rotation, scale, position):
+	
+		self.sample_count += 3
+		
+		if not self.stream:
+			self.keyframes_rotation.Append(time, rotation)
+			self.keyframes_scale.Append(time, scale)
+			self.keyframes_position.Append(time, position)
+			return
+			
+		if self.streams is None:
+			self.streams = [Track_Stream(self.keyframes_rotation, self.rotation_threshold, slerp=True),
+				Track_Stream(self.keyframes_scale, self.scale_threshold),
+				Track_Stream(self.keyframes_position, self.translation_threshold)]
+				
+		for stream, value in zip(self.streams, (rotation, scale, position)):
+			stream.Append(time, value)
 		
 	def GetKeyframeCount(self) :
 		return len(self.keyframes_rotation)
 		
-	def Keyframes_Optimize(self, keyframes, threshold, slerp=False) :
+	# (track, threshold, slerp) of each channel still to be optimized. Authored hermite keys are already minimal.
+	def Channels_Optimizable(self):
+		channels = [(self.keyframes_position, self.translation_threshold, False), 
+			(self.keyframes_scale, self.scale_threshold, False), 
+			(self.keyframes_rotation, self.rotation_threshold, True)]
+			
+		return [channel for channel in channels if len(channel[0]) >= 2 and not channel[0].Is_Hermite()]
+		
+	# Streamed tracks were reduced as they were sampled.
+	def Streams_Finish(self):
+		if self.streams is None:
+			return False
+			
+		for stream in self.streams:
+			stream.Finish()
+			
+		return True
+		
+	# Remove keyframes which can be reproduced within threshold by interpolating the keyframes kept around them, or for cubic,
+	# replace them with the hermite knots of a curve fit reproducing every sample within threshold.
+	def Optimize(self, cubic=False):
+	
+		if self.Streams_Finish():
+			return
+			
+		for track, threshold, slerp in self.Channels_Optimizable():
+			indices, tangents = Track_Optimize(track.Times(), track.Values(), threshold, slerp, cubic)
+			track.Select(indices, tangents, tangents)
+		
+	def GetSampleCount(self) :
+		return len(self.keyframes_rotation) + len(self.keyframes_scale) + len(self.keyframes_position)
+		
+	# The animation between times start & end, with times relative to start.
+	def Slice(self, start, end):
+		sliced = Animation(self.name)
+		sliced.keyframes_rotation = Track_Slice(self.keyframes_rotation, start, end, slerp=True)
+		sliced.keyframes_scale = Track_Slice(self.keyframes_scale, start, end)
+		sliced.keyframes_position = Track_Slice(self.keyframes_position, start, end)
+		return sliced
+		
 
-		done = False
+# Shape key (morph target) weights of a mesh - one track with a component per non basis shape key, in shape key order.
+# Optimization & writing are shared with Animation through Channel_Tracks & Channels_Optimizable, but there are no
+# rotation, scale or position tracks.
+class MorphAnimation(Animation):
 
-		while not done:
+	# TODO: Add as a configuration parameter if required.
+	weight_threshold = 0.001
+	
+	target = "morph"
+	
+	def __init__(self, id, targets, capacity=0):
+		self.name = id
+		self.keyframes_weight = Track(targets, capacity)
+		
+		self.stream = False
+		self.streams = None
+		self.sample_count = 0
+		
+	# Keep the displacement caused by weight error below error, where reach bounds the displacement of unit weight error.
+	def Tolerance_Set(self, error, reach):
+		self.weight_threshold = error / max(reach, error)
+		
+	def Tolerance_Scale(self, factor):
+		self.weight_threshold *= factor
+		
+	def Sample_Tolerance(self):
+		return np.full(self.keyframes_weight.components, self.weight_threshold)
+		
+	def Sample_Append(self, time, weights):
+		self.sample_count += 1
+		self.keyframes_weight.Append(time, weights)
+		
+	def Channel_Tracks(self):
+		return [("weight", self.keyframes_weight)]
+		
+	def GetKeyframeCount(self) :
+		return len(self.keyframes_weight)
+		
+	def Channels_Optimizable(self):
+		track = self.keyframes_weight
+		return [(track, self.weight_threshold, False)] if len(track) >= 2 and not track.Is_Hermite() else []
+		
+	def GetSampleCount(self) :
+		return len(self.keyframes_weight)
+		
+	def Slice(self, start, end):
+		sliced = MorphAnimation(self.name, self.keyframes_weight.components)
+		sliced.keyframes_weight = Track_Slice(self.keyframes_weight, start, end)
+		return sliced
 		
-			done = True
 
-			count = len(keyframes)
+# Key identifying armatures whose bones provably move identically - the same armature data & action, with every pose channel
+# currently equal & no drivers, NLA or constraints to move bones differently. None if the armature isn't such an instance.
+# With world space tolerances, bone tracks are reduced for the armature's world scale, so instances must share it too.
+def Armature_Instance_Key(bobj, world_space=False):
 
-			if count > 2:
-				for index in range(0, count-2) :
+	animation_data = bobj.animation_data
+	
+	if animation_data is None or animation_data.action is None:
+		return None
+		
+	if len(animation_data.drivers) or len(animation_data.nla_tracks) or animation_data.use_tweak_mode:
+		return None
+		
+	if getattr(animation_data, 'action_influence', 1.0) != 1.0 or getattr(animation_data, 'action_blend_type', 'REPLACE') != 'REPLACE':
+		return None
+		
+	if bobj.data.animation_data is not None and len(bobj.data.animation_data.drivers):
+		return None
+		
+	bones = bobj.pose.bones
+	
+	if any(len(pose_bone.constraints) for pose_bone in bones):
+		return None
+		
+	# Unkeyed channels keep their values, so instances must agree on them too.
+	basis = np.empty(len(bones) * 16, dtype=np.float32)
+	bones.foreach_get("matrix_basis", basis)
+	
+	key = (bobj.data.as_pointer(), animation_data.action.as_pointer(), basis.tobytes(), tuple(pose_bone.rotation_mode for pose_bone in bones))
+	
+	if world_space:
+		key += (tuple(bobj.matrix_world.to_scale()),)
+		
+	return key
+	
+	
+# Optimizes the channels of every queued animation once sampling is complete. Channels are independent, so with more than
+# one worker they are spread over a process pool. Results are applied in queue order, so output doesn't depend on scheduling.
+# Workers are spawned rather than forked - a forked copy of Blender can inherit a lock held by another of its threads & hang.
+# Should the pool fail or not finish within the worker timeout, channels are optimized serially instead.
+class AnimationOptimizer:
+	def __init__(self, exporter):
+		self.exporter = exporter
+		self.jobs = []
+		self.generators = []
+		
+	# Generators registered are notified once their animations have been optimized.
+	def Register(self, generator):
+		if generator not in self.generators:
+			self.generators.append(generator)
+			
+	def Queue(self, animation, cubic=False):
+	
+		if animation.Streams_Finish():
+			return
+			
+		for track, threshold, slerp in animation.Channels_Optimizable():
+			self.jobs.append((track, threshold, slerp, cubic))
+			
+	def Results_Parallel(self, workers):
+	
+		arguments = list(zip(*[(track.Times(), track.Values(), threshold, slerp, cubic) for track, threshold, slerp, cubic in self.jobs]))
+		chunk_size = max(1, len(self.jobs) // (workers * 4))
+		
+		# The track module only needs NumPy. Workers import it as a top level module from the add-on directory, which they
+		# inherit on sys.path, so they never load bpy or the add-on package.
+		directory = os.path.dirname(os.path.abspath(__file__))
+		sys.path.insert(0, directory)
+		
+		try:
+			track_module = importlib.import_module("xsg_export_animation_track")
+			pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+			
+			try:
+				results = list(pool.map(track_module.Track_Optimize, *arguments, chunksize=chunk_size, timeout=self.exporter.config.animation_worker_timeout))
+			except FuturesTimeoutError:
+				# Workers may be stuck, so stop them rather than waiting for them to finish.
+				for process in list(pool._processes.values()):
+					process.terminate()
+				pool.shutdown(wait=False, cancel_futures=True)
+				raise
+				
+			pool.shutdown()
+			return results
+		finally:
+			sys.path.remove(directory)
+			
+	def Run(self):
+	
+		workers = min(self.exporter.config.animation_workers, len(self.jobs))
+		results = None
+		
+		if workers > 1:
+			try:
+				results = self.Results_Parallel(workers)
+			except FuturesTimeoutError:
+				self.exporter.Log("Animation optimization : worker pool took over {:g} seconds, continuing serially".format(self.exporter.config.animation_worker_timeout))
+			except (OSError, ImportError, BrokenProcessPool) as error:
+				self.exporter.Log("Animation optimization : worker pool failed ({}), continuing serially".format(error))
 				
-					time_0 = keyframes[index].time
-					time_1 = keyframes[index+1].time
-					time_2 = keyframes[index+2].time
+		if results is None:
+			results = [Track_Optimize(track.Times(), track.Values(), threshold, slerp, cubic) for track, threshold, slerp, cubic in self.jobs]
+			
+		for (track, threshold, slerp, cubic), (indices, tangents) in zip(self.jobs, results):
+			track.Select(indices, tangents, tangents)
+			
+		self.jobs = []
+		
+		for generator in self.generators:
+			generator.Keyframes_Optimized()
+			
 
-					alpha = (time_1-time_0)/(time_2-time_0)
+# Dependency analysis - works out which objects & pose bones can change over the frame range, so static ones needn't be sampled.
 
-					key_0 = keyframes[index].value
-					key_1 = keyframes[index+1].value
-					key_2 = keyframes[index+2].value
+OBJECT_TRANSFORM_PATHS = { 'location', 'rotation_euler', 'rotation_quaternion', 'rotation_axis_angle', 'scale',
+	'delta_location', 'delta_rotation_euler', 'delta_rotation_quaternion', 'delta_scale' }
 
-					if slerp:
-						interp = key_0.slerp(key_2, alpha)
-						diff = interp - key_1
-						len_squared = (diff.x * diff.x) + (diff.y * diff.y) + (diff.z * diff.z) + (diff.w * diff.w)
-						zap = len_squared <= threshold   # could square root this but as it's just a threshold, it'll do & faster.
-					else:
-						interp = key_0.lerp(key_2, alpha)						
-						diff = interp - key_1
-						zap = diff.length <= threshold
+# Data paths animated by an object's action, unmuted NLA strips & drivers.
+def AnimationData_Paths(animation_data):
 
-					if zap:
-						del keyframes[index+1]
-						done = False
-						break
+	paths = set()
+	
+	if animation_data is None:
+		return paths
+		
+	actions = [animation_data.action] if animation_data.action is not None else []
+	
+	for track in animation_data.nla_tracks:
+		if not track.mute:
+			actions += [strip.action for strip in track.strips if strip.action is not None and not strip.mute]
+			
+	for action in actions:
+		paths.update(fcurve.data_path for fcurve in action.fcurves if not fcurve.mute)
+		
+	paths.update(driver.data_path for driver in animation_data.drivers if not driver.mute)
+	
+	return paths
+	
+	
+# Bone name of a 'pose.bones["name"]...' data path, otherwise None.
+def DataPath_Bone(path):
 
-			elif count > 1 :
-				diff = keyframes[index+1].value - keyframes[index].value
+	if not path.startswith('pose.bones["'):
+		return None
+		
+	end = path.find('"]', 12)
+	return path[12:end] if end >= 0 else None
+	
+	
+# Can the object's transform relative to its parent change over the frame range ?
+def Object_Is_Animated(bobj):
 
-				if slerp:
-					len_squared = (diff.x * diff.x) + (diff.y * diff.y) + (diff.z * diff.z) + (diff.w * diff.w)
-					zap = len_squared <= threshold   # could square root this but as it's just a threshold, it'll do & faster.
-				else:
-					zap = diff.length <= threshold
-						
-				if zap:
-					del keyframes[index+1]
+	if len(bobj.constraints) or bobj.rigid_body is not None:
+		return True
+		
+	if not OBJECT_TRANSFORM_PATHS.isdisjoint(AnimationData_Paths(bobj.animation_data)):
+		return True
+		
+	# Object parenting leaves the local transform independent of the parent's motion. Bone & vertex parents don't.
+	if bobj.parent is not None and bobj.parent_type not in ('OBJECT', 'ARMATURE', 'LATTICE'):
+		parent = bobj.parent
 		
+		if Object_Is_Animated(parent) or parent.data is not None and getattr(parent.data, 'shape_keys', None) is not None:
+			return True
+			
+		if bobj.parent_type == 'BONE' and parent.type == 'ARMATURE' and parent.pose is not None:
+			return bool(Bones_Animated(parent).any())
+			
+		return bobj.parent_type != 'BONE' and len(parent.modifiers) > 0
+		
+	return False
+	
+	
+# Can the weights of the object's relative shape keys change over the frame range ?
+def Shape_Keys_Animated(bobj):
+
+	key = getattr(bobj.data, 'shape_keys', None) if bobj.type == 'MESH' else None
+	
+	if key is None or not key.use_relative or len(key.key_blocks) < 2:
+		return False
+		
+	return any(path.startswith('key_blocks[') for path in AnimationData_Paths(key.animation_data))
+	
+	
+# Per pose bone - can the bone's transform relative to its parent change over the frame range ?
+def Bones_Animated(bobj):
+
+	bones = bobj.pose.bones
+	animated_names = { DataPath_Bone(path) for path in AnimationData_Paths(bobj.animation_data) }
+	
+	animated = np.array([pose_bone.name in animated_names or len(pose_bone.constraints) > 0 for pose_bone in bones], dtype=bool)
+	parents = [bones.find(pose_bone.parent.name) if pose_bone.parent else -1 for pose_bone in bones]
+	
+	# IK solvers move the bones of the chain above their owner, chain_count bones including the owner, zero reaching the root.
+	for index, pose_bone in enumerate(bones):
+		for constraint in pose_bone.constraints:
+			if constraint.type in ('IK', 'SPLINE_IK'):
+				count = constraint.chain_count
+				parent = parents[index]
+				
+				while parent >= 0 and count != 1:
+					animated[parent] = True
+					parent = parents[parent]
+					count -= 1
+					
+	# A bone moving its children relative to itself means those children don't fully inherit its rotation & scale.
+	# Parents are resolved before their children, iteratively as static chains (hair, cloth) can be thousands of bones deep.
+	for index in Hierarchy_Order(parents).tolist():
+		parent = parents[index]
 		
-	def Optimize(self):
+		if parent >= 0 and not animated[index] and animated[parent]:
+			bone = bones[index].bone
+			animated[index] = not bone.use_inherit_rotation or bone.inherit_scale != 'FULL'
+			
+	return animated
 	
-		# TODO: Add these as configuration parameters if required.
-		scale_threshold = 0.01
-		translation_threshold = 0.01
-		rotation_threshold = 0.0001
+
+# Steps through the scene frame range once, recording the transforms of every registered animation generator at each frame.
+# Each scene.frame_set() re-evaluates the whole scene, so sampling all animated objects in a single sweep avoids
+# re-evaluating the timeline once per object.
+class AnimationSampler:
+	def __init__(self, exporter):
+		self.exporter = exporter
+		self.generators = []
+		
+		# Armature_Instance_Key -> the generator sampling bones which move identically.
+		self.instances = {}
+		
+	def Register(self, generator):
+		if generator not in self.generators:
+			self.generators.append(generator)
+			
+	# Set the scene to frame & capture the state of every generator.
+	def Capture(self, frame):
+		bpy.context.scene.frame_set(frame)
+		return [generator.Keyframes_Capture() for generator in self.generators]
+		
+	# Sample every stride frames, then test the midpoint of each interval against interpolating its ends - refining intervals
+	# which deviate from linear motion until all are in tolerance or a frame apart. Frames which are skipped are reproduced by 
+	# interpolation, so only the frames sampled are recorded.
+	# Frames are evaluated out of order, so simulations must be baked.
+	def Run_Adaptive(self):
+		scene = bpy.context.scene
+		frame_period = scene.render.fps_base / scene.render.fps
+		
+		frame_last = scene.frame_end - 1
+		frames = list(range(scene.frame_start, frame_last + 1, self.exporter.config.animation_sample_stride))
+		
+		if frames[-1] != frame_last:
+			frames.append(frame_last)
+			
+		states = { frame : self.Capture(frame) for frame in frames }
+		tolerance = np.concatenate([generator.Keyframes_Tolerance() for generator in self.generators])
+		
+		intervals = list(zip(frames[:-1], frames[1:]))
+		
+		while len(intervals):
+			first, last = intervals.pop()
+			
+			if last - first < 2:
+				continue
+				
+			middle = (first + last) // 2
+			states[middle] = self.Capture(middle)
+			
+			start, end, sample = (np.concatenate(states[frame]) for frame in (first, last, middle))
+				
+			alpha = (middle - first) / (last - first)
+			
+			if (np.abs(start + (end - start) * alpha - sample) > tolerance).any():
+				intervals += [(first, middle), (middle, last)]
+				
+		self.exporter.Log("Adaptive sampling : {} of {} frames sampled".format(len(states), scene.frame_end - scene.frame_start))
 		
-		self.Keyframes_Optimize(self.keyframes_position, translation_threshold)
-		self.Keyframes_Optimize(self.keyframes_scale, scale_threshold)
-		self.Keyframes_Optimize(self.keyframes_rotation, rotation_threshold, slerp=True)
+		for frame in sorted(states):
+			time = (frame - scene.frame_start) * frame_period
+			
+			for generator, state in zip(self.generators, states[frame]):
+				generator.Keyframes_Record(time, state)
+				
+	def Run(self):
+		scene = bpy.context.scene
+		frame_current = scene.frame_current
+		frame_period = scene.render.fps_base / scene.render.fps
 		
+		if len(self.generators) and scene.frame_end > scene.frame_start and self.exporter.config.animation_sampling == 'ADAPTIVE':
+			self.Run_Adaptive()
+			scene.frame_set(frame_current)
+			
+		elif len(self.generators):
+			for frame in range(scene.frame_start, scene.frame_end):
+				
+				self.exporter.Log('frame: ' + str(frame))
+				
+				scene.frame_set(frame)
+				
+				time = (frame-scene.frame_start) * frame_period
+				
+				for generator in self.generators:
+					generator.Keyframes_Sample(time)
+		
+			scene.frame_set(frame_current)
+		
+		for generator in self.generators:
+			generator.Keyframes_Finish()
+			
 
 # Creates a list of animation objects based on the animation needs of the Export_Base passed to it.
 class AnimationGenerator: # Base class, do not use directly.
@@ -117,6 +553,33 @@ class AnimationGenerator: # Base class, do not use directly.
 		self.name = id
 		self.export_object = export_object
 		self.animations = []
+		
+		# Length of the animation in seconds, when not the scene frame range.
+		self.period = None
+		
+	# Called by the AnimationSampler once the scene has been set to a frame - returns the state to record as a flat array.
+	def Keyframes_Capture(self):
+		return np.zeros(0)
+		
+	# Largest deviation of each state component from interpolation which adaptive sampling leaves unrefined.
+	def Keyframes_Tolerance(self):
+		return np.zeros(0)
+		
+	# Record a state captured at time. States are recorded in time order.
+	def Keyframes_Record(self, time, state):
+		pass
+		
+	# Called by the AnimationSampler once the scene has been set to each frame.
+	def Keyframes_Sample(self, time):
+		self.Keyframes_Record(time, self.Keyframes_Capture())
+		
+	# Called by the AnimationSampler after the last frame has been sampled.
+	def Keyframes_Finish(self):
+		pass
+		
+	# Called by the AnimationOptimizer once the animations queued have been optimized.
+	def Keyframes_Optimized(self):
+		pass
 
 
 # Creates one animation object that contains the rotation, scale, and position keyframes for the export_object
@@ -124,10 +587,10 @@ class Animation_Convert_Default(AnimationGenerator):
 
 	def __init__(self, exporter, id, export_object):
 		AnimationGenerator.__init__(self, exporter, id, export_object)
+		self.object_animation = None
 		self.Keyframes_Generate()
 		
 	def Keyframes_Generate(self):
-		scene = bpy.context.scene
 		
 		blender_armatures = Util.Modifier_Armatures_Collect(self.export_object.blender_object)
 		
@@ -139,39 +602,269 @@ class Animation_Convert_Default(AnimationGenerator):
 
 		bobj = self.export_object.blender_object
 		
+		if not Object_Is_Animated(bobj):
+			self.exporter.Log("Animation : {} is static".format(self.export_object.name))
+			return
+		
 		# Projectors (camera, lights) point a different direction in their local coordinate system than their xsg equivalents, so we must compensate accordingly.
-		is_projector = True if bobj.type  == 'CAMERA' or bobj.type  == 'LAMP' else False
+		self.is_projector = True if bobj.type  == 'CAMERA' or bobj.type  == 'LAMP' else False
+		
+		scene = bpy.context.scene
+		stream = self.exporter.config.animation_compression == 'STREAM'
+		self.object_animation = Animation(self.export_object.name, 0 if stream else scene.frame_end - scene.frame_start, stream)
+		
+		# The object's rotation & scale errors displace its surface by up to its bounding radius.
+		if self.exporter.config.animation_error_mode == 'WORLD':
+			self.object_animation.Tolerance_Set(self.exporter.config.animation_visual_error, bobj.dimensions.length / 2)
+		
+		if self.Keyframes_Generate_Direct(self.object_animation):
+		
+			if self.exporter.config.export_fcurves:
+				self.Keyframes_Replace_Authored(self.object_animation)
+				
+			self.exporter.animation_optimizer.Queue(self.object_animation, self.exporter.config.animation_compression == 'CUBIC')
+			self.animations.append(self.object_animation)
+			self.object_animation = None
+			return
 		
-		anim = Animation(self.export_object.name)
+		self.exporter.animation_sampler.Register(self)
+		
+	# Objects whose local transform comes purely from their action's F-curves are evaluated directly for all frames at once, 
+	# rather than via a scene.frame_set() per frame. Returns False when motion may depend on anything else (constraints, drivers, 
+	# NLA, physics, bone or vertex parents), in which case the object is sampled.
+	def Keyframes_Generate_Direct(self, anim):
+	
+		bobj = self.export_object.blender_object
+		animation_data = bobj.animation_data
+		
+		if animation_data is None or animation_data.action is None:
+			return False
+			
+		if len(animation_data.drivers) or len(animation_data.nla_tracks) or animation_data.use_tweak_mode:
+			return False
+			
+		if getattr(animation_data, 'action_influence', 1.0) != 1.0 or getattr(animation_data, 'action_blend_type', 'REPLACE') != 'REPLACE':
+			return False
+			
+		if len(bobj.constraints) or bobj.rigid_body is not None:
+			return False
+		
+		# Object parenting leaves the local transform independent of the parent's motion : matrix_local = matrix_parent_inverse @ matrix_basis
+		if bobj.parent is not None and bobj.parent_type != 'OBJECT':
+			return False
+			
+		if bobj.rotation_mode == 'AXIS_ANGLE':
+			return False
+			
+		if tuple(bobj.delta_location) != (0, 0, 0) or tuple(bobj.delta_rotation_euler) != (0, 0, 0) or \
+			tuple(bobj.delta_rotation_quaternion) != (1, 0, 0, 0) or tuple(bobj.delta_scale) != (1, 1, 1):
+			return False
+			
+		rotation_path = 'rotation_quaternion' if bobj.rotation_mode == 'QUATERNION' else 'rotation_euler'
+		
+		# Unanimated channels keep their current value.
+		channels = { 'location' : list(bobj.location), rotation_path : list(getattr(bobj, rotation_path)), 'scale' : list(bobj.scale) }
 		
 		scene = bpy.context.scene
 		frame_period = scene.render.fps_base / scene.render.fps
+		frames = np.arange(scene.frame_start, scene.frame_end, dtype=np.float64)
+		
+		self.fcurves = { path : {} for path in channels }
+		
+		for fcurve in animation_data.action.fcurves:
+		
+			if fcurve.mute:
+				continue
+				
+			if fcurve.data_path in channels:
+				channels[fcurve.data_path][fcurve.array_index] = FCurve_Values(fcurve, frames)
+				self.fcurves[fcurve.data_path][fcurve.array_index] = fcurve
+			elif fcurve.data_path.startswith('delta_') or fcurve.data_path == 'rotation_axis_angle':
+				return False
 		
-		for frame in range(scene.frame_start, scene.frame_end):
+		def Channel(components):
+			return np.stack([np.broadcast_to(np.asarray(c, dtype=np.float64), frames.shape) for c in components], axis=-1)
 			
-			scene.frame_set(frame)
+		if bobj.rotation_mode == 'QUATERNION':
+			rotation = Quaternions_To_Matrices(Channel(channels[rotation_path]))
+		else:
+			rotation = Eulers_To_Matrices(Channel(channels[rotation_path]), bobj.rotation_mode)
 			
-			time = (frame-scene.frame_start) * frame_period
+		transform = Matrices_Compose(Channel(channels['location']), rotation, Channel(channels['scale']))
+		
+		if bobj.parent is not None:
+			transform = np.array(bobj.matrix_parent_inverse) @ transform
 			
-			transform = self.exporter.Transform_Convert(bobj.matrix_local)
+		transform = Matrices_Flip_Axis(transform)
+		
+		if self.is_projector:
+			transform = Matrices_Adjust_Projector(transform)
 			
-			if is_projector:
-				transform = Util.Transform_Adjust_Projector(transform)
+		positions, scales, rotations = Matrices_Decompose(transform)
+		rotations = Quaternions_Continuous(rotations)
+		
+		times = (frames - scene.frame_start) * frame_period
+		
+		anim.keyframes_rotation.Append_Block(times, rotations)
+		anim.keyframes_scale.Append_Block(times, scales)
+		anim.keyframes_position.Append_Block(times, positions)
+			
+		return True
+		
+	# Replace baked location & scale keyframes with the authored F-curve keys wherever they map exactly onto node position & scale.
+	# Requires the object's direct evaluation to have succeeded, as that guarantees the F-curves are all that moves it.
+	def Keyframes_Replace_Authored(self, anim):
+	
+		bobj = self.export_object.blender_object
+		
+		# A parent inverse mixes channels together.
+		if bobj.parent is not None and not np.allclose(np.array(bobj.matrix_parent_inverse), np.identity(4)):
+			return
+			
+		track = self.Keyframes_From_FCurves(self.fcurves['location'], bobj.location)
+		
+		if track is not None:
+			anim.keyframes_position = track
+			
+		# Projectors swap their local axes, so their scale doesn't map directly.
+		if self.is_projector:
+			return
+			
+		track = self.Keyframes_From_FCurves(self.fcurves['scale'], bobj.scale, positive=True)
+		
+		if track is not None:
+			anim.keyframes_scale = track
+			
+	# Convert the F-curves of a 3 component channel to a hermite keyframe track - converting coordinate system. 
+	# Returns None unless all animated components are keyed at the same frames within the frame range, using linear or
+	# bezier interpolation with handles a third of the way along each segment. Such a bezier is exactly a cubic in time,
+	# so its handle slopes are its hermite tangents.
+	def Keyframes_From_FCurves(self, fcurves, current, positive=False):
+	
+		if len(fcurves) == 0:
+			return None
+			
+		scene = bpy.context.scene
+		frame_period = scene.render.fps_base / scene.render.fps
+		
+		key_frames = None
+		values = []
+		tangents_in = []
+		tangents_out = []
+		
+		for index in range(0, 3):
+			fcurve = fcurves.get(index)
+			
+			if fcurve is None:
+				values.append(current[index])
+				tangents_in.append(0.0)
+				tangents_out.append(0.0)
+				continue
+				
+			if len(fcurve.modifiers) or fcurve.extrapolation != 'CONSTANT':
+				return None
 				
-			rotation = transform.to_quaternion().normalized()
+			points = fcurve.keyframe_points
+			count = len(points)
 			
-			anim.keyframes_rotation.append(Keyframe(time, rotation))
-
-			scale = transform.to_scale()
-			anim.keyframes_scale.append(Keyframe(time, scale))
-
-			position = transform.to_translation()
-			anim.keyframes_position.append(Keyframe(time, position))
+			co = np.empty(count * 2)
+			handle_left = np.empty(count * 2)
+			handle_right = np.empty(count * 2)
+			
+			points.foreach_get("co", co)
+			points.foreach_get("handle_left", handle_left)
+			points.foreach_get("handle_right", handle_right)
+			
+			co = co.reshape(-1, 2)
+			handle_left = handle_left.reshape(-1, 2)
+			handle_right = handle_right.reshape(-1, 2)
+			
+			if key_frames is None:
+				key_frames = co[:, 0]
+				
+				if key_frames[0] < scene.frame_start or key_frames[-1] > scene.frame_end - 1:
+					return None
+					
+			elif len(co) != len(key_frames) or not np.allclose(co[:, 0], key_frames, atol=1e-4):
+				return None
+				
+			if positive and (co[:, 1] <= 0).any():
+				return None
+				
+			tangent_in = np.zeros(count)
+			tangent_out = np.zeros(count)
+			
+			# The last key's interpolation mode describes no segment.
+			for k, point in enumerate(points[:-1]):
+			
+				length = co[k+1, 0] - co[k, 0]
+				
+				if point.interpolation == 'LINEAR':
+					tangent_out[k] = tangent_in[k+1] = (co[k+1, 1] - co[k, 1]) / length
+					
+				elif point.interpolation == 'BEZIER':
+					out_length = handle_right[k, 0] - co[k, 0]
+					in_length = co[k+1, 0] - handle_left[k+1, 0]
+					
+					if abs(out_length - length / 3) > length * 1e-3 or abs(in_length - length / 3) > length * 1e-3:
+						return None
+						
+					tangent_out[k] = (handle_right[k, 1] - co[k, 1]) / out_length
+					tangent_in[k+1] = (co[k+1, 1] - handle_left[k+1, 1]) / in_length
+				else:
+					return None
+					
+			values.append(co[:, 1])
+			tangents_in.append(tangent_in)
+			tangents_out.append(tangent_out)
+			
+		def Components(channel):
+			return np.stack([np.broadcast_to(np.asarray(c, dtype=np.float64), key_frames.shape) for c in (channel[0], channel[2], channel[1])], axis=-1)
+			
+		track = Track(3, len(key_frames))
+		track.Append_Block((key_frames - scene.frame_start) * frame_period, Components(values))
+		
+		# Tangents are converted from value per frame to value per second.
+		track.tangents_in = Components(tangents_in) / frame_period
+		track.tangents_out = Components(tangents_out) / frame_period
+		
+		return track
+		
+	# State is the (w, x, y, z) rotation, scale & position.
+	def Keyframes_Capture(self):
+		
+		if self.object_animation is None:
+			return np.zeros(0)
+			
+		transform = self.exporter.Transform_Convert(self.export_object.blender_object.matrix_local)
+		
+		if self.is_projector:
+			transform = Util.Transform_Adjust_Projector(transform)
+			
+		rotation = transform.to_quaternion().normalized()
+		scale = transform.to_scale()
+		position = transform.to_translation()
+		
+		return np.array((*rotation, *scale, *position))
+		
+	def Keyframes_Tolerance(self):
+		return np.zeros(0) if self.object_animation is None else self.object_animation.Sample_Tolerance()
 		
-		anim.Optimize()
+	def Keyframes_Record(self, time, state):
 		
-		self.animations.append(anim)
-		scene.frame_set(scene.frame_current)
+		if self.object_animation is None:
+			return
+			
+		self.object_animation.Sample_Append(time, state[0:4], state[4:7], state[7:10])
+		
+	def Keyframes_Finish(self):
+		
+		if self.object_animation is None:
+			return
+			
+		self.exporter.animation_optimizer.Queue(self.object_animation, self.exporter.config.animation_compression == 'CUBIC')
+		
+		self.animations.append(self.object_animation)
 
 		
 # Creates an animation object for each of the export_objects
@@ -180,19 +873,99 @@ class AnimationGenerator_Group(AnimationGenerator):
 	def __init__(self, exporter, id, export_objects):
 		AnimationGenerator.__init__(self, exporter, id, None)
 		self.export_objects = export_objects
+		self.generators = []
 		
 		self.Keyframes_Generate()
 	
 	def Keyframes_Generate(self):
 		for obj in self.export_objects:
 			if obj.blender_object.type == 'ARMATURE':
-				temporary_generator = Animation_Convert_Armature(self.exporter, None, Object)
-				self.animations += temporary_generator.animations
+				self.generators.append(Animation_Convert_Armature(self.exporter, None, obj))
 			else:
-				temporary_generator = Animation_Convert_Default(self.exporter,	None, Object)
-				self.animations += temporary_generator.animations
+				self.generators.append(Animation_Convert_Default(self.exporter, None, obj))
+				
+			# Shape keys with an action of their own are written as a set of that action.
+			if Shape_Keys_Action(obj.blender_object) is None:
+				self.generators.append(Animation_Convert_Morph(self.exporter, None, obj))
+				
+		# Registered after the generators it contains so their animations are complete by the time we're finished.
+		self.exporter.animation_sampler.Register(self)
+		
+	def Keyframes_Finish(self):
+		for generator in self.generators:
+			self.animations += generator.animations
 
 
+# Action of the object's shape keys, if any.
+def Shape_Keys_Action(bobj):
+	key = getattr(bobj.data, 'shape_keys', None) if bobj.type == 'MESH' else None
+	return key.animation_data.action if key is not None and key.animation_data is not None else None
+	
+	
+# Creates a morph animation holding the shape key weights of a mesh's export_object. Weights are sampled with the scene, as
+# drivers commonly derive them from bones or custom properties.
+class Animation_Convert_Morph(AnimationGenerator):
+
+	def __init__(self, exporter, id, export_object):
+		AnimationGenerator.__init__(self, exporter, id, export_object)
+		self.morph_animation = None
+		self.Keyframes_Generate()
+		
+	def Keyframes_Generate(self):
+	
+		bobj = self.export_object.blender_object
+		
+		if not self.exporter.config.export_morphs or self.export_object.disable_animation or not Shape_Keys_Animated(bobj):
+			return
+			
+		self.key_blocks = bobj.data.shape_keys.key_blocks
+		self.weights = np.empty(len(self.key_blocks), dtype=np.float32)
+		
+		scene = bpy.context.scene
+		self.morph_animation = MorphAnimation(self.export_object.name, len(self.key_blocks) - 1, scene.frame_end - scene.frame_start)
+		
+		# Unit weight error on every shape key together displaces a vertex by at most the root sum square of the largest
+		# offset of each.
+		if self.exporter.config.animation_error_mode == 'WORLD':
+			coordinates = np.empty(len(self.key_blocks[0].data) * 3, dtype=np.float32)
+			reach = 0.0
+			
+			for block in self.key_blocks[1:]:
+				block.data.foreach_get("co", coordinates)
+				offsets = coordinates.reshape(-1, 3).copy()
+				block.relative_key.data.foreach_get("co", coordinates)
+				offsets -= coordinates.reshape(-1, 3)
+				reach += float((offsets * offsets).sum(axis=1).max(initial=0.0))
+				
+			self.morph_animation.Tolerance_Set(self.exporter.config.animation_visual_error, np.sqrt(reach))
+			
+		self.exporter.animation_sampler.Register(self)
+		
+	# State is the weight of each non basis shape key.
+	def Keyframes_Capture(self):
+	
+		if self.morph_animation is None:
+			return np.zeros(0)
+			
+		self.key_blocks.foreach_get("value", self.weights)
+		return self.weights[1:].astype(np.float64)
+		
+	def Keyframes_Tolerance(self):
+		return np.zeros(0) if self.morph_animation is None else self.morph_animation.Sample_Tolerance()
+		
+	def Keyframes_Record(self, time, state):
+		if self.morph_animation is not None:
+			self.morph_animation.Sample_Append(time, state)
+			
+	def Keyframes_Finish(self):
+	
+		if self.morph_animation is None:
+			return
+			
+		self.exporter.animation_optimizer.Queue(self.morph_animation, self.exporter.config.animation_compression == 'CUBIC')
+		self.animations.append(self.morph_animation)
+		
+		
 # Creates an animation object for the armature for each bone (influence) in the armature.
 class Animation_Convert_Armature(Animation_Convert_Default):
 	def __init__(self, exporter, id, export_object):
@@ -200,66 +973,385 @@ class Animation_Convert_Armature(Animation_Convert_Default):
 		self.Animation_Convert_Skin_Influences(exporter)
 		
 	def Animation_Convert_Skin_Influences(self, exporter):
-		from itertools import zip_longest as zip
+		
+		bobj = self.export_object.blender_object
+		
+		exporter.Log('convert_anim: ' + self.export_object.name)
+		
+		# Instances of an armature already being sampled share its bone animations.
+		instance_key = Armature_Instance_Key(bobj, exporter.config.animation_error_mode == 'WORLD')
+		instance = exporter.animation_sampler.instances.get(instance_key) if instance_key is not None else None
+		
+		if instance is not None:
+			exporter.Log("Animation : {} bones move as {}, not sampled".format(self.export_object.name, instance.export_object.name))
+			self.influence_animations = []
+			self.animations += instance.influence_animations
+			return
+			
+		if instance_key is not None:
+			exporter.animation_sampler.instances[instance_key] = self
+			
+		# Create animation objects for each influence (pose bone in Blender terminology) ...
 		
 		scene = bpy.context.scene
+		stream = exporter.config.animation_compression == 'STREAM'
+		capacity = 0 if stream else scene.frame_end - scene.frame_start
+		
+		# ... for the bones which can move.
+		animated = Bones_Animated(bobj)
+		self.influence_indices = np.flatnonzero(animated)
+		self.influence_animations = [Animation(Util.SafeName(bobj.pose.bones[int(index)].name), capacity, stream) for index in self.influence_indices]
+		
+		if not animated.all():
+			exporter.Log("Animation : {} {} of {} bones static".format(self.export_object.name, len(animated) - len(self.influence_indices), len(animated)))
+			
+			if exporter.config.verbose:
+				exporter.Log("   " + ", ".join(pose_bone.name for pose_bone, moves in zip(bobj.pose.bones, animated) if not moves))
+		
+		# Pose matrices for all bones are fetched with a single foreach_get per frame.
+		self.bone_parents = np.array([bobj.pose.bones.find(pose_bone.parent.name) if pose_bone.parent else -1 for pose_bone in bobj.pose.bones], dtype=np.int64)
+		self.bone_matrices = np.empty(len(bobj.pose.bones) * 16, dtype=np.float32)
+		self.bone_rotations = None
+		self.bone_locals = None
+		
+		if exporter.config.animation_error_mode == 'WORLD':
+			self.Tolerances_Set(bobj, animated)
+			
+		if len(self.influence_animations):
+			exporter.animation_sampler.Register(self)
+		
+	# Spread the visual error over the moving bones of the longest chain, as each bone's error adds to those below it.
+	# A bone's rotation & scale errors displace its descendants by up to its reach - the furthest rest pose distance from 
+	# its head to a descendant's tail.
+	def Tolerances_Set(self, bobj, animated):
+	
+		bones = bobj.pose.bones
+		parents = self.bone_parents
+		
+		heads = np.array([pose_bone.bone.head_local for pose_bone in bones]).reshape(-1, 3)
+		tails = np.array([pose_bone.bone.tail_local for pose_bone in bones]).reshape(-1, 3)
+		
+		# Number of moving bones from the root to each bone.
+		chain = animated.astype(np.int64)
+		
+		for index in Hierarchy_Order(parents):
+			if parents[index] >= 0:
+				chain[index] += chain[parents[index]]
+				
+		# Walk every bone's tail up through its ancestors a level at a time.
+		reach = np.zeros(len(bones))
+		descendants = np.arange(len(bones))
+		ancestors = descendants.copy()
 		
+		while len(ancestors):
+			np.maximum.at(reach, ancestors, np.linalg.norm(tails[descendants] - heads[ancestors], axis=-1))
+			
+			above = parents[ancestors]
+			descendants = descendants[above >= 0]
+			ancestors = above[above >= 0]
+			
+		# Bone space errors are magnified by the armature's scale.
+		self.world_scale = max(max(bobj.matrix_world.to_scale()), 1e-6)
+		self.bone_error = self.exporter.config.animation_visual_error / self.world_scale
+		self.bone_lengths = np.array([pose_bone.bone.length for pose_bone in bones])
+		
+		budget = self.bone_error / max(int(chain.max(initial=0)), 1)
+		
+		for anim, index in zip(self.influence_animations, self.influence_indices):
+			anim.Tolerance_Set(budget, reach[index])
+			
+	# State is the object's followed by the rotation, scale & position of each moving bone.
+	def Keyframes_Capture(self):
+		
+		state = Animation_Convert_Default.Keyframes_Capture(self)
+		
+		if len(self.influence_animations) == 0:
+			return state
+			
 		bobj = self.export_object.blender_object
+		bobj.pose.bones.foreach_get("matrix", self.bone_matrices)
 		
-		#anim = Animation(self.export_object.name)
+		# Blender stores matrices column major.
+		matrices = self.bone_matrices.reshape(-1, 4, 4).transpose(0, 2, 1)
 		
-		exporter.Log('convert_anim: ' + self.export_object.name)
+		influence_to_parent = Matrices_Flip_Axis(Matrices_Parent_Relative(matrices, self.bone_parents))
 		
-		# Create animation objects for each influence (pose bone in Blender terminology) ...
+		# Static bones keep these transforms - world space error verification rebuilds the skeleton from them.
+		if self.bone_locals is None:
+			self.bone_locals = influence_to_parent
+			
+		positions, scales, rotations = Matrices_Decompose(influence_to_parent[self.influence_indices])
 		
-		influence_animations = [Animation(Util.SafeName(skin_influence.name)) for skin_influence in bobj.pose.bones]
+		return np.concatenate((state, np.concatenate((rotations, scales, positions), axis=1).reshape(-1)))
 		
-		scene = bpy.context.scene
-		frame_period = scene.render.fps_base / scene.render.fps
+	def Keyframes_Tolerance(self):
+		return np.concatenate([Animation_Convert_Default.Keyframes_Tolerance(self)] + [anim.Sample_Tolerance() for anim in self.influence_animations])
+		
+	def Keyframes_Record(self, time, state):
+		
+		objects = 0 if self.object_animation is None else 10
+		Animation_Convert_Default.Keyframes_Record(self, time, state[:objects])
+		
+		if len(self.influence_animations) == 0:
+			return
+			
+		bones = state[objects:].reshape(-1, 10)
+		rotations = bones[:, 0:4]
+		
+		# Keep consecutive rotations in the same hemisphere so interpolation takes the short path.
+		if self.bone_rotations is not None:
+			rotations = np.where((rotations * self.bone_rotations).sum(axis=-1, keepdims=True) < 0, -rotations, rotations)
+			
+		self.bone_rotations = rotations
+		
+		for index, anim in enumerate(self.influence_animations):
+			anim.Sample_Append(time, rotations[index], bones[index, 4:7], bones[index, 7:10])
+			
+	def Keyframes_Finish(self):
+		
+		Animation_Convert_Default.Keyframes_Finish(self)
+		
+		cubic = self.exporter.config.animation_compression == 'CUBIC'
+		
+		# World space verification needs the samples the optimized keyframes replace.
+		self.samples = None
+		
+		if self.exporter.config.animation_error_mode == 'WORLD' and len(self.influence_animations) and self.influence_animations[0].streams is None:
+			self.samples = (self.influence_animations[0].keyframes_rotation.Times().copy(),
+				[(anim.keyframes_rotation.Values().copy(), anim.keyframes_scale.Values().copy(), anim.keyframes_position.Values().copy())
+				for anim in self.influence_animations])
+				
+		for anim in self.influence_animations:
+			self.exporter.animation_optimizer.Queue(anim, cubic)
+			
+		self.animations += self.influence_animations
+		
+		self.exporter.animation_optimizer.Register(self)
+		
+	def Keyframes_Optimized(self):
+	
+		if self.samples is not None:
+			times, sampled = self.samples
+			self.Keyframes_Verify(times, sampled, self.exporter.config.animation_compression == 'CUBIC')
+			self.samples = None
+			
+		samples = sum(anim.sample_count for anim in self.influence_animations)
+		keys = sum(anim.GetSampleCount() for anim in self.influence_animations)
+		
+		self.exporter.Log("Animation compression : {} {} samples -> {} keys ({:.1f}:1)".format(self.export_object.name, samples, keys, samples / max(keys, 1)))
 
-		for frame in range(scene.frame_start, scene.frame_end):
+	# World space positions of every bone's head & tail at each frame, from (frames, moving bones, components) transforms.
+	def Bones_Endpoints(self, rotations, scales, positions):
+	
+		local = np.repeat(self.bone_locals[np.newaxis], len(rotations), axis=0)
+		local[:, self.influence_indices] = Matrices_Compose(positions, Quaternions_To_Matrices(rotations), scales)
+		
+		world = Matrices_World(local, self.bone_parents)
+		
+		# Bones extend along their y axis, which is z once flipped.
+		tails = world[..., :3, 3] + world[..., :3, 2] * self.bone_lengths[:, np.newaxis]
+		
+		return world[..., :3, 3], tails
+		
+	# Rebuild the skeleton from the optimized keyframes, comparing bone endpoints against the samples. Bones straying beyond
+	# the visual error have the tolerances of the moving bones above them tightened & those bones are optimized again, up to
+	# TIGHTEN_ROUNDS times. Bones still beyond the visual error after the last round are reported.
+	def Keyframes_Verify(self, times, sampled, cubic):
+	
+		FRAMES_PER_BATCH = 1024
+		TIGHTEN_ROUNDS = 8
+		
+		slots = np.full(len(self.bone_parents), -1, dtype=np.int64)
+		slots[self.influence_indices] = np.arange(len(self.influence_indices))
+		
+		sampled_rotations = np.stack([rotations for rotations, scales, positions in sampled], axis=1)
+		sampled_scales = np.stack([scales for rotations, scales, positions in sampled], axis=1)
+		sampled_positions = np.stack([positions for rotations, scales, positions in sampled], axis=1)
+		
+		# The samples don't change between rounds, so their endpoints are only rebuilt once.
+		batches = [slice(first, first + FRAMES_PER_BATCH) for first in range(0, len(times), FRAMES_PER_BATCH)]
+		sampled_endpoints = [self.Bones_Endpoints(sampled_rotations[batch], sampled_scales[batch], sampled_positions[batch]) for batch in batches]
+		
+		for iteration in range(0, TIGHTEN_ROUNDS + 1):
+		
+			rotations = np.stack([Track_Evaluate(anim.keyframes_rotation, times, slerp=True) for anim in self.influence_animations], axis=1)
+			scales = np.stack([Track_Evaluate(anim.keyframes_scale, times) for anim in self.influence_animations], axis=1)
+			positions = np.stack([Track_Evaluate(anim.keyframes_position, times) for anim in self.influence_animations], axis=1)
 			
-			exporter.Log('frame: ' + str(frame))
+			deviation = np.zeros(len(self.bone_parents))
 			
-			scene.frame_set(frame)
+			for batch, (sampled_heads, sampled_tails) in zip(batches, sampled_endpoints):
+				heads, tails = self.Bones_Endpoints(rotations[batch], scales[batch], positions[batch])
+				
+				deviation = np.maximum(deviation, np.linalg.norm(heads - sampled_heads, axis=-1).max(axis=0))
+				deviation = np.maximum(deviation, np.linalg.norm(tails - sampled_tails, axis=-1).max(axis=0))
+				
+			failing = np.flatnonzero(deviation > self.bone_error)
 			
-			for pose_bone, anim in zip(bobj.pose.bones, influence_animations):
-							
-				transform = Matrix()
+			self.exporter.Log("Animation error : {} maximum {:.6g} of {:.6g} visual error, {} bones over".format(
+				self.export_object.name, deviation.max(initial=0) * self.world_scale, self.bone_error * self.world_scale, len(failing)))
 				
-				if pose_bone.parent:
-					transform = pose_bone.parent.matrix.inverted()
-				 
-				# Remember Blenderp performs multiplies right to left & on matrices they're not commutitive (doh).
-				transform @= pose_bone.matrix
-				influence_to_parent = self.exporter.Transform_Convert(transform)
+			if len(failing) == 0:
+				return
+				
+			if iteration == TIGHTEN_ROUNDS:
+				bones = self.export_object.blender_object.pose.bones
+				names = [bones[int(index)].name for index in failing]
+				
+				self.exporter.Log("Animation error : WARNING {} bones of {} still over the visual error after {} rounds : {}{}".format(
+					len(names), self.export_object.name, TIGHTEN_ROUNDS, ", ".join(names[:16]), ", ..." if len(names) > 16 else ""))
+				return
+				
+			tighten = set()
 			
-				time = (frame-scene.frame_start) * frame_period
+			for index in failing:
+				while index >= 0:
+					if slots[index] >= 0:
+						tighten.add(int(slots[index]))
+					index = self.bone_parents[index]
+					
+			for slot in sorted(tighten):
+				anim = self.influence_animations[slot]
+				anim.Tolerance_Scale(0.5)
+				anim.Samples_Restore(times, *sampled[slot])
+				anim.Optimize(cubic)
+
 
-				scale = influence_to_parent.to_scale()
-				anim.keyframes_scale.append(Keyframe(time, scale))
+# Creates an animation for each pose bone an action keys, evaluating the action's F-curves directly rather than by stepping 
+# the scene, so any number of actions can be exported for an armature without assigning them. Covers the action's own frame 
+# range. A bone's transform relative to its parent is its rest pose relative to its parent's, followed by its pose channels :
+#
+#     rest_relative @ basis
+#
+# Constraints, drivers & partial rotation or scale inheritance aren't evaluated - bones relying on them are reported.
+class Animation_Convert_Action(AnimationGenerator):
 
-				position = influence_to_parent.to_translation()
-				anim.keyframes_position.append(Keyframe(time, position))
+	POSE_CHANNELS = ('location', 'rotation_quaternion', 'rotation_euler', 'rotation_axis_angle', 'scale')
+	
+	def __init__(self, exporter, id, export_object, action):
+		AnimationGenerator.__init__(self, exporter, id, export_object)
+		self.action = action
+		self.Keyframes_Generate()
+		
+	def Keyframes_Generate(self):
+	
+		bobj = self.export_object.blender_object
+		bones = bobj.pose.bones
+		
+		scene = bpy.context.scene
+		frame_period = scene.render.fps_base / scene.render.fps
+		
+		frame_start, frame_end = (int(round(frame)) for frame in self.action.frame_range)
+		frames = np.arange(frame_start, frame_end + 1, dtype=np.float64)
+		times = (frames - frame_start) * frame_period
+		
+		self.period = max(frame_end + 1 - frame_start, 1) * frame_period
+		
+		# Bone name -> data path -> component index -> values at frames.
+		channels = {}
+		
+		for fcurve in self.action.fcurves:
+			bone_name = DataPath_Bone(fcurve.data_path)
+			path = fcurve.data_path.rsplit('.', 1)[-1]
+			
+			if fcurve.mute or bone_name is None or path not in self.POSE_CHANNELS or bones.get(bone_name) is None:
+				continue
 				
-				rotation = influence_to_parent.to_quaternion().normalized()
-				prev_rotation = anim.keyframes_rotation[-1].value if len(anim.keyframes_rotation) else rotation
-				anim.keyframes_rotation.append(Keyframe(time, Util.CompatibleQuaternion(rotation, prev_rotation)))
+			channels.setdefault(bone_name, {}).setdefault(path, {})[fcurve.array_index] = FCurve_Values(fcurve, frames)
+			
+		approximate = []
+		
+		for bone_name, paths in channels.items():
+		
+			pose_bone = bones[bone_name]
+			bone = pose_bone.bone
+			
+			if len(pose_bone.constraints) or not bone.use_inherit_rotation or bone.inherit_scale != 'FULL' or not bone.use_local_location:
+				approximate.append(bone_name)
 				
-				#exporter.Log('pose_bone: ' + pose_bone.name)
-	
-		for anim in influence_animations:
-			anim.Optimize()
+			# Unkeyed components keep their current pose value.
+			def Channel(path, count):
+				current = getattr(pose_bone, path)
+				keyed = paths.get(path, {})
+				return np.stack([np.broadcast_to(np.asarray(keyed.get(index, current[index]), dtype=np.float64), frames.shape) for index in range(0, count)], axis=-1)
+				
+			if pose_bone.rotation_mode == 'QUATERNION':
+				rotation = Quaternions_To_Matrices(Channel('rotation_quaternion', 4))
+			elif pose_bone.rotation_mode == 'AXIS_ANGLE':
+				axis_angle = Channel('rotation_axis_angle', 4)
+				axis = axis_angle[:, 1:] / np.maximum(np.linalg.norm(axis_angle[:, 1:], axis=-1, keepdims=True), 1e-12)
+				half = axis_angle[:, :1] / 2
+				rotation = Quaternions_To_Matrices(np.concatenate((np.cos(half), np.sin(half) * axis), axis=-1))
+			else:
+				rotation = Eulers_To_Matrices(Channel('rotation_euler', 3), pose_bone.rotation_mode)
+				
+			basis = Matrices_Compose(Channel('location', 3), rotation, Channel('scale', 3))
+			
+			rest_relative = np.array(bone.matrix_local)
+			
+			if bone.parent is not None:
+				rest_relative = np.linalg.inv(np.array(bone.parent.matrix_local)) @ rest_relative
+				
+			positions, scales, rotations = Matrices_Decompose(Matrices_Flip_Axis(rest_relative @ basis))
+			
+			anim = Animation(Util.SafeName(bone_name), len(frames))
+			anim.Samples_Restore(times, Quaternions_Continuous(rotations), scales, positions)
+			
+			self.exporter.animation_optimizer.Queue(anim, self.exporter.config.animation_compression == 'CUBIC')
 			self.animations.append(anim)
+			
+		self.exporter.Log("Action {} : {} bones keyed over frames {} to {}".format(self.action.name, len(self.animations), frame_start, frame_end))
 		
-		scene.frame_set(scene.frame_current)
-
-
-# Container for all animation_generators that belong in a single AnimationSet
+		if len(approximate):
+			self.exporter.Log("Action {} : constraints & partial inheritance not evaluated for {}".format(self.action.name, ", ".join(approximate)))
+			
+			
+# Container for all animation_generators that belong in a single AnimationSet. A set with a frame range holds the part of the
+# sampled animation from frame_range[0] up to frame_range[1].
 class AnimationSet:
-	def __init__(self, id, animation_generators):
+	def __init__(self, id, animation_generators, frame_range=None, named=True, period=None):
 		self.name = id
 		self.animation_generators = animation_generators
+		self.frame_range = frame_range
+		self.named = named
+		self.period = period
+		
+	# Animations of the set, sliced to its frame range.
+	def Animations(self):
+		animations = [animation for generator in self.animation_generators for animation in generator.animations]
+		
+		if self.frame_range is None:
+			return animations
+			
+		scene = bpy.context.scene
+		frame_period = scene.render.fps_base / scene.render.fps
+		
+		# The last frame sampled in the range.
+		start = (self.frame_range[0] - scene.frame_start) * frame_period
+		end = (self.frame_range[1] - 1 - scene.frame_start) * frame_period
+		
+		return [animation.Slice(start, end) for animation in animations]
+		
+	
+# Clips defined by timeline markers, as (name, first frame, end frame) within the scene frame range. Each marker starts a clip
+# running up to the next marker or the scene end. Markers named 'end' or '<clip>.end' only end the clip before them.
+def Clips_Collect():
+
+	scene = bpy.context.scene
+	markers = sorted((marker.frame, marker.name) for marker in scene.timeline_markers if scene.frame_start <= marker.frame < scene.frame_end)
+	
+	clips = []
+	
+	for index, (frame, name) in enumerate(markers):
+		if name == 'end' or name.endswith('.end'):
+			continue
+			
+		end = markers[index + 1][0] if index + 1 < len(markers) else scene.frame_end
+		
+		if end - frame > 1:
+			clips.append((Util.SafeName(name), frame, end))
+			
+	return clips
 
 
 # Writes all animation data to file.  
@@ -269,11 +1361,174 @@ class AnimationWriter:
 		self.exporter = exporter
 		self.animation_generators = animation_generators
 		self.animation_sets = []
+		self.time_ids = {}
+		self.channel_ids = {}
+		self.sidecar = None
+		self.encoding_errors = {}
+		
+	def Times_Format(self, track):
+		return "".join("{:9f} ".format(time) for time in track.Times().tolist())
+		
+	# Keyframe tracks of the animations which will be written.
+	def Set_Tracks(self, animations):
+		for animation in animations:
+			for dest, track in animation.Channel_Tracks():
+				if len(track) > 1:
+					yield track
+					
+	# Content of an animation's channel, equal for animations which would be written identically.
+	def Channel_Signature(self, animation):
+		signature = [animation.target]
+		
+		for dest, track in animation.Channel_Tracks():
+			signature.append(track.Times().tobytes() + track.Values().tobytes() if len(track) > 1 else b'')
+			
+			if len(track) > 1 and track.Is_Hermite():
+				signature.append(track.tangents_in.tobytes() + track.tangents_out.tobytes())
+				
+		return tuple(signature)
+		
+	# Channels identical to another of the set - such as bones of instanced characters - are written once, with a key the
+	# others reference.
+	def Channels_Share(self, animations):
+	
+		self.channel_ids = {}
+		
+		if not self.exporter.config.share_channels:
+			return
+			
+		counts = {}
+		
+		for animation in animations:
+			signature = self.Channel_Signature(animation)
+			counts[signature] = counts.get(signature, 0) + 1
+			
+		for signature, count in counts.items():
+			if count > 1:
+				self.channel_ids[signature] = "c{}".format(len(self.channel_ids))
+				
+		if len(self.channel_ids):
+			self.exporter.Log("Shared channels : {} for {} channels".format(len(self.channel_ids), sum(counts[signature] for signature in self.channel_ids)))
+			
+	# Split every set into a set per clip, when clips are defined.
+	def Clips_Split(self):
+	
+		if self.exporter.config.animation_clips != 'MARKERS':
+			return
+			
+		clips = Clips_Collect()
+		
+		if len(clips) == 0:
+			self.exporter.Log("Animation clips : no timeline markers in the frame range")
+			return
+			
+		# Sets covering their own frame range, such as actions, aren't split.
+		self.animation_sets = [split for set in self.animation_sets for split in ([set] if set.period is not None else
+			[AnimationSet("{}.{}".format(set.name, name) if set.named and set.name else name, set.animation_generators, (start, end))
+			for name, start, end in clips])]
+			
+	# Time arrays shared by more than one keyframes element of the set are written once at the start of the set & referenced by id.
+	def TimeTracks_Write(self, animations):
+	
+		self.time_ids = {}
+		
+		if not self.exporter.config.share_time_tracks:
+			return
+			
+		counts = {}
+		tracks = {}
+		
+		for track in self.Set_Tracks(animations):
+			key = track.Times().tobytes()
+			counts[key] = counts.get(key, 0) + 1
+			tracks[key] = track
+			
+		for key, count in counts.items():
+			if count > 1:
+				time_id = "t{}".format(len(self.time_ids))
+				self.time_ids[key] = time_id
+				self.exporter.file.Write('<time id="{}">{}</time>\n'.format(time_id, self.Times_Format(tracks[key])))
+				
+		if len(self.time_ids):
+			self.exporter.Log("Shared time tracks : {} for {} keyframe elements".format(len(self.time_ids), sum(counts[key] for key in self.time_ids)))
+			
+	# Write a value array element. Text unless compact encoding is enabled, when unit quaternions are smallest three encoded
+	# & everything else quantized to 16 bits across each component's range, written inline as base64 or to the sidecar.
+	# The largest encoding error is recorded per error_key.
+	def Values_Write(self, tag, error_key, values, value_format, columns, smallest_three=False):
+	
+		file = self.exporter.file
+		encoding = self.exporter.config.animation_encoding
+		
+		if encoding == 'TEXT':
+			file.Write('<{0}>{1}</{0}>\n'.format(tag, self.Rows_Format(values, value_format, columns)))
+			return
+			
+		values = values[:, columns]
+		
+		if smallest_three:
+			encoded, error = Quaternion_Smallest_Three_Encode(values, 15)
+			attributes = 'encoding="smallest3" bits="15"'
+		else:
+			encoded, offset, scale, error = Quantize_Range(values, 16)
+			attributes = 'encoding="range" bits="16" offset="{}" scale="{}"'.format(
+				" ".join("{:.9g}".format(v) for v in offset), " ".join("{:.9g}".format(v) for v in scale))
+				
+		self.encoding_errors[error_key] = max(self.encoding_errors.get(error_key, 0.0), error)
+		
+		data = np.ascontiguousarray(encoded, dtype='<u2').tobytes()
+		
+		if encoding == 'SIDECAR':
+			file.Write('<{} {} data_offset="{}" data_size="{}"/>\n'.format(tag, attributes, self.sidecar.Write(data), len(data)))
+		else:
+			file.Write('<{0} {1}>{2}</{0}>\n'.format(tag, attributes, base64.b64encode(data).decode('ascii')))
+			
+	# Format the rows of an (N, C) array, reordering components by columns.
+	def Rows_Format(self, values, value_format, columns):
+		return "".join(value_format.format(*row) for row in values[:, columns].tolist())
+		
+	# (value format, columns) of a keyframes element. Rotations are written x y z w.
+	def Keyframes_Format(self, dest, track):
+		if dest == "rotation":
+			return "{:9f} {:9f} {:9f} {:9f} ", [1, 2, 3, 0]
+			
+		return "{:9f} " * track.components + " ", list(range(0, track.components))
+		
+	# Write a keyframes element - times, values & for hermite tracks, their incoming & outgoing tangents.
+	def Keyframes_Write(self, dest, track, value_format, columns):
+	
+		file = self.exporter.file
+		hermite = track.Is_Hermite()
+		
+		time_id = self.time_ids.get(track.Times().tobytes())
+		
+		file.Write('<keyframes dest="{}"{}{}>\n'.format(dest, ' interpolation="hermite"' if hermite else '', ' time="{}"'.format(time_id) if time_id else ''))
+		file.Indent()
+
+		if time_id is None:
+			file.Write('<time>' + self.Times_Format(track) + '</time>\n')
+			
+		self.Values_Write('value', dest, track.Values(), value_format, columns, smallest_three=dest == 'rotation')
+		
+		if hermite:
+			# Tangents are rates of change, so their errors are recorded apart from the values'.
+			self.Values_Write('in', dest + ' tangent', track.tangents_in, value_format, columns)
+			self.Values_Write('out', dest + ' tangent', track.tangents_out, value_format, columns)
+			
+		file.Unindent()
+		file.Write('</keyframes>\n')
 		
 	# Write all animation sets. 
 	def AnimationSets_Write(self):
-			
-		self.exporter.file.Indent()
+		
+		self.Clips_Split()
+		
+		data = ''
+		
+		if self.exporter.config.animation_encoding == 'SIDECAR':
+			self.sidecar = Sidecar(os.path.splitext(self.exporter.file.filepath)[0] + ".anim.bin")
+			self.sidecar.Open()
+			data = ' data="{}"'.format(os.path.basename(self.sidecar.filepath))
 		
 		scene = bpy.context.scene
 		frame_period = scene.render.fps_base / scene.render.fps
@@ -282,109 +1537,77 @@ class AnimationWriter:
 		for set in self.animation_sets:
 			self.exporter.Log("Writing animation set {}".format(set.name))
 			
+			self.exporter.file.Indent()
+			
+			period = anim_period
+			
+			if set.period is not None:
+				period = set.period
+			elif set.frame_range is not None:
+				period = (set.frame_range[1] - set.frame_range[0]) * frame_period
+			
 			self.exporter.file.Write('\n')
-			self.exporter.file.Write('<animation period="{}" seq="l">\n'.format(anim_period))
-			#self.exporter.file.Write('id="{}">\n'.format(set.name))
+			self.exporter.file.Write('<animation{} period="{}" seq="l"{}>\n'.format(' id="{}"'.format(set.name) if set.named and set.name else '', period, data))
 			self.exporter.file.Indent()
 			
-			# Write animation for each generator ...
+			animations = set.Animations()
 			
-			for generator in set.animation_generators:
+			self.TimeTracks_Write(animations)
+			self.Channels_Share(animations)
 			
-				#self.exporter.file.Write('gen\n')
+			channels_written = {}
+			
+			# Write animation for each generator ...
+			
+			for current_animation in animations:
 				
-				for current_animation in generator.animations:
-					
-					#self.exporter.file.Write('anim\n')
+				self.exporter.Log("Writing animation of {}".format(current_animation.name))
 				
-					self.exporter.Log("Writing animation of {}".format(current_animation.name))
-					
-					# Skip animation channels containing no animation data (i.e. static content)
-					if (len(current_animation.keyframes_rotation) < 2) and (len(current_animation.keyframes_scale) < 2) and (len(current_animation.keyframes_position) < 2) :
-						continue
-					
-					self.exporter.file.Indent()
-					self.exporter.file.Write('<channel id="{}" target="node">\n'.format(current_animation.name))
-					self.exporter.file.Indent()
-					
-					if len(current_animation.keyframes_rotation) > 1 : 
-					
-						self.exporter.file.Write('<keyframes dest="rotation">\n');
-						self.exporter.file.Indent()
-
-						self.exporter.file.Write('<time>')
-						for key in current_animation.keyframes_rotation :
-							self.exporter.file.Write("{:9f} ".format(key.time), Indent=False)
-
-						self.exporter.file.Write('</time>\n')					
-					
-						self.exporter.file.Write('<value>')
-					
-						for key in current_animation.keyframes_rotation :
-							self.exporter.file.Write("{:9f} {:9f} {:9f} {:9f} ".format(key.value.x, key.value.y, key.value.z, key.value.w), Indent=False)
-						
-						self.exporter.file.Write('</value>\n')					
-						self.exporter.file.Unindent()
-						self.exporter.file.Write('</keyframes>\n')					
-					
-					# Write scale keys
+				# Skip animation channels containing no animation data (i.e. static content)
+				if all(len(track) < 2 for dest, track in current_animation.Channel_Tracks()) :
+					continue
+				
+				self.exporter.file.Indent()
+				
+				channel_id = self.channel_ids.get(self.Channel_Signature(current_animation)) if len(self.channel_ids) else None
+				
+				if channel_id in channels_written:
+					self.exporter.file.Write('<channel id="{}" target="{}" ref="{}"/>\n'.format(current_animation.name, current_animation.target, channel_id))
+					self.exporter.file.Unindent()
+					continue
 					
-					if len(current_animation.keyframes_scale) > 1 : 
+				if channel_id is not None:
+					channels_written[channel_id] = current_animation.name
 					
-						self.exporter.file.Write('<keyframes dest="scale">\n');
-						self.exporter.file.Indent()
-						
-						self.exporter.file.Write('<time>')
-						for key in current_animation.keyframes_scale :
-							self.exporter.file.Write("{:9f} ".format(key.time), Indent=False)
-
-						self.exporter.file.Write('</time>\n')					
+				self.exporter.file.Write('<channel id="{}" target="{}"{}>\n'.format(current_animation.name, current_animation.target, ' key="{}"'.format(channel_id) if channel_id else ''))
+				self.exporter.file.Indent()
+				
+				# Write rotation, scale & position keys, or morph weight keys ...
+				
+				for dest, track in current_animation.Channel_Tracks():
+					if len(track) > 1 : 
+						self.Keyframes_Write(dest, track, *self.Keyframes_Format(dest, track))
 
-						self.exporter.file.Write('<value>')
-						
-						for key in current_animation.keyframes_scale :
-							self.exporter.file.Write("{:9f} {:9f} {:9f}  ".format(key.value[0], key.value[1], key.value[2]), Indent=False)
-						
-						self.exporter.file.Write('</value>\n')
-						self.exporter.file.Unindent()
-						self.exporter.file.Write('</keyframes>\n')
-										
-										
-				   # Write position keys ...
-					
-					if len(current_animation.keyframes_position) > 1 : 
-					
-						self.exporter.file.Write('<keyframes dest="position">\n');
-						self.exporter.file.Indent()
-						
-						self.exporter.file.Write('<time>')
-						
-						for key in current_animation.keyframes_position:
-							self.exporter.file.Write("{:9f} ".format(key.time), Indent=False)
-						
-						self.exporter.file.Write('</time>\n')
-						
-						self.exporter.file.Write('<value>')
-						
-						for key in current_animation.keyframes_position:
-							self.exporter.file.Write('{:9f} {:9f} {:9f}  '.format(key.value[0], key.value[1], key.value[2]), Indent=False)
-							
-						self.exporter.file.Write('</value>\n')
-						self.exporter.file.Unindent()
-						self.exporter.file.Write('</keyframes>\n')
-
-					self.exporter.Log("ok")
-					
-					self.exporter.file.Unindent()
-					self.exporter.file.Write("</channel>\n")
-					self.exporter.file.Unindent()
-					
+				self.exporter.Log("ok")
+				
+				self.exporter.file.Unindent()
+				self.exporter.file.Write("</channel>\n")
+				self.exporter.file.Unindent()
+				
 			self.exporter.file.Unindent()
 			self.exporter.file.Write("</animation>\n")
 			
 			self.exporter.Log("Finished writing animation set {}".format(set.name))
 			
 			self.exporter.file.Unindent()
+			
+		if self.sidecar is not None:
+			self.sidecar.Close()
+			self.sidecar = None
+			
+		# Rotation error is in degrees, position & scale error in their own units & tangent error in units per second.
+		for dest, error in self.encoding_errors.items():
+			self.exporter.Log("Animation encoding : {} maximum error {:.6g}{}".format(dest, error, " degrees" if dest == 'rotation' else ""))
 	
 
 # Implementation of AnimationWriter that places all generators into a single AnimationSet.
@@ -392,7 +1615,7 @@ class JoinedSetAnimationWriter(AnimationWriter):
 	def __init__(self, exporter, animation_generators):
 		AnimationWriter.__init__(self, exporter, animation_generators)
 		
-		self.animation_sets = [AnimationSet("Global", self.animation_generators)]
+		self.animation_sets = [AnimationSet("Global", self.animation_generators, named=False)]
 		
 
 # Implementation of AnimationWriter that places each generator into its own AnimationSet
@@ -400,5 +1623,5 @@ class SplitSetAnimationWriter(AnimationWriter):
 	def __init__(self, exporter, animation_generators):
 		AnimationWriter.__init__(self, exporter, animation_generators)
 		
-		self.animation_sets = [AnimationSet(Generator.name, [Generator])
+		self.animation_sets = [AnimationSet(Generator.name, [Generator], period=Generator.period)
 			for Generator in animation_generators]
\ No newline at end of file
@@ -0,0 +1,707 @@
+################################################################################################################################
+#
+# Copyright (c) 2023, Advance Software Limited. All rights reserved.
+#
+# Redistribution and use in source and binary forms with or without
+# modification are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL ADVANCE SOFTWARE LIMITED BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# This file : Animation track math - pure NumPy, no Blender dependencies.
+#
+#             Quaternions are stored in Blender (w, x, y, z) component order.
+#
+# ------------------------------------------------------------------------------------------------------------------------------
+
+import numpy as np
+
+
+# Contiguous keyframe storage for one animation channel - a time array & an (N, components) value array, appended in
+# preallocated blocks. Hermite tracks also carry incoming & outgoing tangents, in value units per second.
+
+class Track:
+
+	BLOCK_SIZE = 256
+
+	def __init__(self, components, capacity=0):
+		self.components = components
+		self.count = 0
+		self.times = np.empty(max(capacity, self.BLOCK_SIZE))
+		self.values = np.empty((len(self.times), components))
+		self.tangents_in = None
+		self.tangents_out = None
+
+	def __len__(self):
+		return self.count
+
+	def Reserve(self, capacity):
+		if capacity > len(self.times):
+			self.times = np.resize(self.times, capacity)
+			self.values = np.resize(self.values, (capacity, self.components))
+
+	def Append(self, time, value):
+		if self.count == len(self.times):
+			self.Reserve(self.count + max(self.count, self.BLOCK_SIZE))
+
+		self.times[self.count] = time
+		self.values[self.count] = value
+		self.count += 1
+
+	def Append_Block(self, times, values):
+		count = len(times)
+		self.Reserve(self.count + count)
+
+		self.times[self.count:self.count + count] = times
+		self.values[self.count:self.count + count] = values
+		self.count += count
+
+	def Times(self):
+		return self.times[:self.count]
+
+	def Values(self):
+		return self.values[:self.count]
+
+	def Last(self):
+		return self.values[self.count - 1]
+
+	def Is_Hermite(self):
+		return self.tangents_in is not None
+
+	# Keep only the keyframes at indices, optionally converting the track to hermite keyframes with the given tangents.
+	def Select(self, indices, tangents_in=None, tangents_out=None):
+		self.times = self.Times()[indices].copy()
+		self.values = self.Values()[indices].copy()
+		self.count = len(self.times)
+
+		if tangents_in is not None:
+			self.tangents_in = np.asarray(tangents_in, dtype=np.float64).reshape(self.count, self.components)
+			self.tangents_out = np.asarray(tangents_out, dtype=np.float64).reshape(self.count, self.components)
+		elif self.tangents_in is not None:
+			self.tangents_in = self.tangents_in[indices]
+			self.tangents_out = self.tangents_out[indices]
+
+
+# Spherical linear interpolation from quaternion q0 to each of q1 by alpha. Takes the shortest path.
+
+def Slerp(q0, q1, alpha):
+
+	alpha = np.asarray(alpha, dtype=np.float64)[..., np.newaxis]
+
+	cosine = (q0 * q1).sum(axis=-1, keepdims=True)
+	q1 = np.where(cosine < 0, -q1, q1)
+	cosine = np.abs(cosine)
+
+	angle = np.arccos(np.clip(cosine, -1.0, 1.0))
+	sine = np.sin(angle)
+
+	# Nearly identical rotations fall back to linear interpolation.
+	linear = sine < 1e-6
+	sine = np.where(linear, 1.0, sine)
+
+	w0 = np.where(linear, 1.0 - alpha, np.sin((1.0 - alpha) * angle) / sine)
+	w1 = np.where(linear, alpha, np.sin(alpha * angle) / sine)
+
+	return w0 * q0 + w1 * q1
+
+
+def Lerp(v0, v1, alpha):
+	alpha = np.asarray(alpha, dtype=np.float64)[..., np.newaxis]
+	return v0 + (v1 - v0) * alpha
+
+
+# Error of approximated values against the samples they replace, in the units the keyframe thresholds are specified in :
+# Squared 4D distance for rotations, distance for positions & scales.
+
+def Track_Error(approximation, samples, slerp=False):
+
+	diff = approximation - samples
+	squared = (diff * diff).sum(axis=-1)
+
+	return squared if slerp else np.sqrt(squared)
+
+
+# Choose the keyframes required to reproduce every sample of a track within threshold, where approximate(first, last, index)
+# returns the approximation of samples index from the keyframes at first & last. Ramer-Douglas-Peucker subdivision - each
+# span is split at its worst sample until all samples it covers are in tolerance.
+# All spans at the same subdivision depth are processed together in one vectorized pass, so cost is O(n log n) for 
+# typical motion & O(n) for static tracks, with a handful of NumPy calls per depth rather than per keyframe.
+# Returns the indices of the keyframes to keep.
+
+def Track_Subdivide(values, threshold, slerp, approximate):
+
+	count = len(values)
+
+	if count < 2:
+		return np.arange(count)
+
+	keep = np.zeros(count, dtype=bool)
+	keep[0] = True
+	keep[-1] = True
+
+	firsts = np.array([0])
+	lasts = np.array([count - 1])
+
+	while len(firsts):
+
+		# Spans with no samples between their keyframes are complete.
+		inner = lasts - firsts - 1
+		active = inner > 0
+		firsts = firsts[active]
+		lasts = lasts[active]
+		inner = inner[active]
+
+		if len(firsts) == 0:
+			break
+
+		# Flatten the samples inside every span into one batch.
+		starts = np.cumsum(inner) - inner
+		span = np.repeat(np.arange(len(firsts)), inner)
+		index = firsts[span] + 1 + (np.arange(len(span)) - starts[span])
+
+		error = Track_Error(approximate(firsts[span], lasts[span], index), values[index], slerp)
+
+		# Worst sample of each span.
+		worst_error = np.maximum.reduceat(error, starts)
+		is_worst = error == worst_error[span]
+		worst_span, worst_position = np.unique(span[is_worst], return_index=True)
+		worst = index[np.flatnonzero(is_worst)[worst_position]]
+
+		split = worst_error[worst_span] > threshold
+
+		# Splitting at the worst sample tracks the motion best, but splits close to a span's end leave nearly all of 
+		# it for the next pass. Clamping the split to the middle half of the span bounds the depth to log4/3(n) passes.
+		span_first = firsts[worst_span]
+		span_last = lasts[worst_span]
+		quarter = (span_last - span_first) // 4
+		splits = np.clip(worst, span_first + quarter, span_last - quarter)
+		splits = np.clip(splits, span_first + 1, span_last - 1)[split]
+		keep[splits] = True
+
+		firsts = np.concatenate((span_first[split], splits))
+		lasts = np.concatenate((splits, span_last[split]))
+
+	indices = np.flatnonzero(keep)
+
+	# A constant track needs only its first keyframe.
+	if len(indices) == 2 and Track_Error(values[0], values, slerp).max() <= threshold:
+		indices = indices[:1]
+
+	return indices
+
+
+# Reduce a sampled track to the keyframes required to reproduce every sample within threshold under linear interpolation,
+# or slerp for rotations. Returns the indices of the keyframes to keep.
+
+def Track_Reduce(times, values, threshold, slerp=False):
+
+	times = np.asarray(times, dtype=np.float64)
+	values = np.asarray(values, dtype=np.float64)
+
+	interpolate = Slerp if slerp else Lerp
+
+	def Approximate(first, last, index):
+		alpha = (times[index] - times[first]) / (times[last] - times[first])
+		return interpolate(values[first], values[last], alpha)
+
+	return Track_Subdivide(values, threshold, slerp, Approximate)
+
+
+# Incremental keyframe reduction of a track as its samples arrive, for timelines too long to hold every sample.
+# The window holds the last keyframe written to the track followed by the samples since. Each new sample is accepted if
+# interpolating from that keyframe to it reproduces every windowed sample within threshold - otherwise the previous sample
+# becomes a keyframe & starts a new window. A full window also forces a keyframe, bounding memory & per sample cost.
+
+class Track_Stream:
+
+	WINDOW_SIZE = 64
+
+	def __init__(self, track, threshold, slerp=False):
+		self.track = track
+		self.threshold = threshold
+		self.slerp = slerp
+		self.times = np.empty(self.WINDOW_SIZE)
+		self.values = np.empty((self.WINDOW_SIZE, track.components))
+		self.count = 0
+		self.constant = True
+
+	def Window_Restart(self):
+		self.track.Append(self.times[self.count - 1], self.values[self.count - 1])
+		self.times[0] = self.times[self.count - 1]
+		self.values[0] = self.values[self.count - 1]
+		self.count = 1
+
+	def Append(self, time, value):
+
+		if self.constant and len(self.track):
+			self.constant = Track_Error(self.track.values[0], np.asarray(value, dtype=np.float64), self.slerp) <= self.threshold
+
+		if self.count == 0:
+			self.track.Append(time, value)
+
+		elif self.count == self.WINDOW_SIZE:
+			self.Window_Restart()
+
+		elif self.count > 1:
+			interpolate = Slerp if self.slerp else Lerp
+			alpha = (self.times[1:self.count] - self.times[0]) / (time - self.times[0])
+			approximation = interpolate(self.values[0], np.asarray(value, dtype=np.float64), alpha)
+
+			if Track_Error(approximation, self.values[1:self.count], self.slerp).max() > self.threshold:
+				self.Window_Restart()
+
+		self.times[self.count] = time
+		self.values[self.count] = value
+		self.count += 1
+
+	# Write the final sample as a keyframe, unless every sample was within threshold of the first, so the track is constant.
+	def Finish(self):
+
+		if self.count > 1:
+			self.Window_Restart()
+
+		if len(self.track) > 1 and self.constant:
+			self.track.Select(np.arange(1))
+
+		self.count = 0
+
+
+# Fit piecewise cubic hermite segments to a sampled track, keeping the fewest knots which reproduce every sample within
+# threshold. Knot tangents are the track's derivative at each sample, so a knot's tangent doesn't change as the spans
+# around it are subdivided. Rotations are fitted componentwise & normalized on evaluation.
+# Returns (indices, tangents) - the indices of the knots to keep & the tangent at each, in value units per time unit.
+
+def Track_Fit_Hermite(times, values, threshold, slerp=False):
+
+	times = np.asarray(times, dtype=np.float64)
+	values = np.asarray(values, dtype=np.float64)
+
+	if len(times) < 2:
+		return np.arange(len(times)), np.zeros(values.shape)
+
+	derivatives = np.gradient(values, times, axis=0, edge_order=1 if len(times) < 3 else 2)
+
+	def Approximate(first, last, index):
+		return Hermite(times[first], values[first], derivatives[first], times[last], values[last], derivatives[last], times[index], slerp)
+
+	indices = Track_Subdivide(values, threshold, slerp, Approximate)
+
+	return indices, derivatives[indices]
+
+
+# Optimize one sampled track - keyframe reduction, or for cubic a hermite curve fit. Runs in worker processes, so takes &
+# returns plain arrays. Returns (indices, tangents) - the indices of the keyframes kept & for cubic, their tangents.
+
+def Track_Optimize(times, values, threshold, slerp=False, cubic=False):
+
+	if cubic:
+		return Track_Fit_Hermite(times, values, threshold, slerp)
+
+	return Track_Reduce(times, values, threshold, slerp), None
+
+
+def Hermite(t0, p0, m0, t1, p1, m1, t, normalize=False):
+
+	dt = (t1 - t0)[..., np.newaxis]
+	s = ((t - t0) / (t1 - t0))[..., np.newaxis]
+	s2 = s * s
+	s3 = s2 * s
+
+	p = (2 * s3 - 3 * s2 + 1) * p0 + (s3 - 2 * s2 + s) * dt * m0 + (-2 * s3 + 3 * s2) * p1 + (s3 - s2) * dt * m1
+
+	return p / np.linalg.norm(p, axis=-1, keepdims=True) if normalize else p
+
+
+# Evaluate a track at times, interpolating between keyframes as the loader does - linear, slerp for rotations or hermite.
+# Times outside the keyed range hold the first or last keyframe.
+
+def Track_Evaluate(track, times, slerp=False):
+
+	times = np.asarray(times, dtype=np.float64)
+	keys = track.Times()
+	values = track.Values()
+
+	if len(keys) == 1:
+		return np.repeat(values, len(times), axis=0)
+
+	span = np.clip(np.searchsorted(keys, times, side='right') - 1, 0, len(keys) - 2)
+	t = np.clip(times, keys[0], keys[-1])
+	t0 = keys[span]
+	t1 = keys[span + 1]
+
+	if track.Is_Hermite():
+		return Hermite(t0, values[span], track.tangents_out[span], t1, values[span + 1], track.tangents_in[span + 1], t, slerp)
+
+	interpolate = Slerp if slerp else Lerp
+	return interpolate(values[span], values[span + 1], (t - t0) / (t1 - t0))
+
+
+# Derivative of hermite segments at t, in value units per time unit.
+
+def Hermite_Derivative(t0, p0, m0, t1, p1, m1, t):
+
+	dt = (t1 - t0)[..., np.newaxis]
+	s = ((t - t0) / (t1 - t0))[..., np.newaxis]
+	s2 = s * s
+
+	return ((6 * s2 - 6 * s) * p0 / dt + (3 * s2 - 4 * s + 1) * m0 + (-6 * s2 + 6 * s) * p1 / dt + (3 * s2 - 2 * s) * m1)
+
+
+# The part of a track between times start & end, with times relative to start. Keyframes are added at start & end unless
+# keyed there, hermite tracks taking the curve's tangents there so the curve is unchanged.
+
+def Track_Slice(track, start, end, slerp=False):
+
+	times = track.Times()
+	values = track.Values()
+
+	if len(track) < 2:
+		sliced = Track(track.components, 1)
+		sliced.Append_Block(np.zeros(len(track)), values)
+		return sliced
+
+	inside = np.flatnonzero((times > start) & (times < end))
+	bounds = np.array([start, end], dtype=np.float64)
+	bound_values = Track_Evaluate(track, bounds, slerp)
+
+	sliced = Track(track.components, len(inside) + 2)
+	sliced.Append(0.0, bound_values[0])
+	sliced.Append_Block(times[inside] - start, values[inside])
+	sliced.Append(end - start, bound_values[1])
+
+	# A bound on a key takes the key's incoming slope from the span ending there & its outgoing slope from the span starting
+	# there, so keys with broken tangents keep both.
+	if track.Is_Hermite():
+		def Slopes(side):
+			span = np.clip(np.searchsorted(times, bounds, side=side) - 1, 0, len(times) - 2)
+			return Hermite_Derivative(times[span], values[span], track.tangents_out[span], times[span + 1], values[span + 1], track.tangents_in[span + 1], bounds)
+
+		slopes_in = Slopes('left')
+		slopes_out = Slopes('right')
+
+		sliced.tangents_in = np.concatenate((slopes_in[:1], track.tangents_in[inside], slopes_in[1:]))
+		sliced.tangents_out = np.concatenate((slopes_out[:1], track.tangents_out[inside], slopes_out[1:]))
+
+	return sliced
+
+
+# Flip quaternion signs so each is in the same hemisphere as its predecessor, keeping interpolation on the shortest path.
+
+def Quaternions_Continuous(q):
+
+	q = np.array(q, dtype=np.float64)
+
+	if len(q) < 2:
+		return q
+
+	flips = (q[1:] * q[:-1]).sum(axis=-1) < 0
+	signs = np.concatenate(([1.0], np.where(np.cumsum(flips) % 2, -1.0, 1.0)))
+
+	return q * signs[:, np.newaxis]
+
+
+# Batched transform construction & decomposition. Matrices are (N, 4, 4) arrays indexed [n, row, column] - the same
+# convention as mathutils Matrix indexing.
+
+def Quaternions_To_Matrices(q):
+
+	q = np.asarray(q, dtype=np.float64)
+	q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+	w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+
+	m = np.empty(q.shape[:-1] + (3, 3))
+	m[..., 0, 0] = 1 - 2 * (y * y + z * z)
+	m[..., 0, 1] = 2 * (x * y - w * z)
+	m[..., 0, 2] = 2 * (x * z + w * y)
+	m[..., 1, 0] = 2 * (x * y + w * z)
+	m[..., 1, 1] = 1 - 2 * (x * x + z * z)
+	m[..., 1, 2] = 2 * (y * z - w * x)
+	m[..., 2, 0] = 2 * (x * z - w * y)
+	m[..., 2, 1] = 2 * (y * z + w * x)
+	m[..., 2, 2] = 1 - 2 * (x * x + y * y)
+
+	return m
+
+
+# Euler rotation order as named by Blender - 'XYZ' rotates about X first, then Y, then Z.
+
+def Eulers_To_Matrices(euler, order='XYZ'):
+
+	euler = np.asarray(euler, dtype=np.float64)
+	m = np.broadcast_to(np.identity(3), euler.shape[:-1] + (3, 3))
+
+	for axis in order:
+		i = 'XYZ'.index(axis)
+		j = (i + 1) % 3
+		k = (i + 2) % 3
+
+		c = np.cos(euler[..., i])
+		s = np.sin(euler[..., i])
+
+		r = np.zeros(euler.shape[:-1] + (3, 3))
+		r[..., i, i] = 1
+		r[..., j, j] = c
+		r[..., j, k] = -s
+		r[..., k, j] = s
+		r[..., k, k] = c
+
+		m = r @ m
+
+	return m
+
+
+def Matrices_Compose(translation, rotation, scale):
+
+	translation = np.asarray(translation, dtype=np.float64)
+	count = translation.shape[:-1]
+
+	m = np.zeros(count + (4, 4))
+	m[..., :3, :3] = rotation * np.asarray(scale, dtype=np.float64)[..., np.newaxis, :]
+	m[..., :3, 3] = translation
+	m[..., 3, 3] = 1
+
+	return m
+
+
+# Decompose affine matrices into translation, scale & normalized (w, x, y, z) rotation, as mathutils to_translation(),
+# to_scale() & to_quaternion() do.
+
+def Matrices_Decompose(m):
+
+	m = np.asarray(m, dtype=np.float64)
+
+	translation = m[..., :3, 3].copy()
+	scale = np.linalg.norm(m[..., :3, :3], axis=-2)
+
+	r = m[..., :3, :3] / np.where(scale > 0, scale, 1.0)[..., np.newaxis, :]
+
+	# Mirrored transforms still yield a valid rotation.
+	r = np.where((np.linalg.det(r) < 0)[..., np.newaxis, np.newaxis], -r, r)
+
+	return translation, scale, Matrices_To_Quaternions(r)
+
+
+# Rotation matrix to quaternion, choosing the numerically stable branch per matrix.
+
+def Matrices_To_Quaternions(r):
+
+	r00, r01, r02 = r[..., 0, 0], r[..., 0, 1], r[..., 0, 2]
+	r10, r11, r12 = r[..., 1, 0], r[..., 1, 1], r[..., 1, 2]
+	r20, r21, r22 = r[..., 2, 0], r[..., 2, 1], r[..., 2, 2]
+
+	trace = r00 + r11 + r22
+
+	candidates = np.stack((
+		np.stack((1 + trace, r21 - r12, r02 - r20, r10 - r01), axis=-1),
+		np.stack((r21 - r12, 1 + r00 - r11 - r22, r01 + r10, r02 + r20), axis=-1),
+		np.stack((r02 - r20, r01 + r10, 1 + r11 - r00 - r22, r12 + r21), axis=-1),
+		np.stack((r10 - r01, r02 + r20, r12 + r21, 1 + r22 - r00 - r11), axis=-1)), axis=-2)
+
+	# Each candidate is the quaternion scaled by 4 * its largest component - pick the one with the largest diagonal.
+	diagonal = np.stack((trace, r00, r11, r22), axis=-1)
+	best = np.argmax(diagonal, axis=-1)
+
+	q = np.take_along_axis(candidates, best[..., np.newaxis, np.newaxis], axis=-2)[..., 0, :]
+	q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+	return np.where(q[..., :1] < 0, -q, q)
+
+
+# Convert from Blender 'Z' up to Infinity/xsg 'Y' up coordinate system - the batched equivalent of XSG_Export.Transform_Convert.
+
+def Matrices_Flip_Axis(m):
+	axes = [0, 2, 1, 3]
+	return np.asarray(m)[..., axes, :][..., :, axes]
+
+
+# Batched parent relative transforms of (N, 4, 4) matrices, where parents holds each matrix's parent index or -1.
+
+def Matrices_Parent_Relative(m, parents):
+	local = np.array(m, dtype=np.float64)
+	child = parents >= 0
+	local[child] = np.linalg.inv(local[parents[child]]) @ local[child]
+	return local
+
+
+# Order of a hierarchy given each node's parent index (or -1), with every parent before its children.
+
+def Hierarchy_Order(parents):
+
+	parents = np.asarray(parents, dtype=np.int64)
+	depth = np.zeros(len(parents), dtype=np.int64)
+	ancestor = parents.copy()
+
+	# Walk every node up a level at a time.
+	while np.any(ancestor >= 0):
+		depth += ancestor >= 0
+		ancestor = np.where(ancestor >= 0, parents[ancestor], -1)
+
+	return np.argsort(depth, kind='stable')
+
+
+# Batched world transforms of (..., N, 4, 4) parent relative matrices.
+
+def Matrices_World(local, parents):
+	world = np.array(local, dtype=np.float64)
+
+	for index in Hierarchy_Order(parents):
+		if parents[index] >= 0:
+			world[..., index, :, :] = world[..., parents[index], :, :] @ world[..., index, :, :]
+
+	return world
+
+
+# Batched equivalent of Util.Transform_Adjust_Projector.
+
+def Matrices_Adjust_Projector(m):
+	out = np.array(m, dtype=np.float64)
+	out[..., :3, 1] = m[..., :3, 2]
+	out[..., :3, 2] = -m[..., :3, 1]
+	return out
+
+
+# F-curve evaluation over many frames at once, for keyframes with constant, linear & bezier interpolation.
+# co, handle_left & handle_right are (K, 2) arrays of (frame, value). Returns None when a keyframe uses another
+# interpolation mode so the caller can fall back to Blender's own evaluation.
+
+FCURVE_INTERPOLATION = { 'CONSTANT' : 0, 'LINEAR' : 1, 'BEZIER' : 2 }
+
+def FCurve_Evaluate(frames, co, handle_left, handle_right, interpolation, extrapolation='CONSTANT'):
+
+	if any(mode not in FCURVE_INTERPOLATION for mode in interpolation):
+		return None
+
+	frames = np.asarray(frames, dtype=np.float64)
+	co = np.asarray(co, dtype=np.float64).reshape(-1, 2)
+	handle_left = np.asarray(handle_left, dtype=np.float64).reshape(-1, 2)
+	handle_right = np.asarray(handle_right, dtype=np.float64).reshape(-1, 2)
+	mode = np.array([FCURVE_INTERPOLATION[i] for i in interpolation], dtype=np.int64)
+
+	count = len(co)
+
+	if count == 0:
+		return np.zeros(len(frames))
+
+	values = np.empty(len(frames))
+
+	# Extrapolation before the first & after the last keyframe.
+	before = frames <= co[0, 0]
+	after = frames >= co[-1, 0]
+
+	values[before] = co[0, 1]
+	values[after] = co[-1, 1]
+
+	if extrapolation == 'LINEAR' and count > 1:
+		values[before] += (frames[before] - co[0, 0]) * Extrapolation_Slope(co[0], co[1], handle_left[0], mode[0])
+		values[after] += (frames[after] - co[-1, 0]) * Extrapolation_Slope(co[-1], co[-2], handle_right[-1], mode[-1])
+
+	inside = ~(before | after)
+
+	if count < 2 or not inside.any():
+		return values
+
+	f = frames[inside]
+	segment = np.clip(np.searchsorted(co[:, 0], f, side='right') - 1, 0, count - 2)
+
+	p0 = co[segment]
+	p3 = co[segment + 1]
+	p1 = handle_right[segment].copy()
+	p2 = handle_left[segment + 1].copy()
+
+	# Blender scales handles which overshoot their segment in time, keeping each segment a function of time.
+	h1 = p0[:, 0] - p1[:, 0]
+	h2 = p3[:, 0] - p2[:, 0]
+	length = p3[:, 0] - p0[:, 0]
+	total = np.abs(h1) + np.abs(h2)
+	fac = np.where(total > length, length / np.where(total > 0, total, 1.0), 1.0)
+	p1 = p0 - fac[:, np.newaxis] * (p0 - p1)
+	p2 = p3 - fac[:, np.newaxis] * (p3 - p2)
+
+	# Solve x(u) = frame for the bezier parameter by bisection - x(u) is monotonic once handles are corrected.
+	lo = np.zeros(len(f))
+	hi = np.ones(len(f))
+
+	for iteration in range(0, 40):
+		u = (lo + hi) * 0.5
+		x = Bezier(p0[:, 0], p1[:, 0], p2[:, 0], p3[:, 0], u)
+		below = x < f
+		lo = np.where(below, u, lo)
+		hi = np.where(below, hi, u)
+
+	u = (lo + hi) * 0.5
+	bezier = Bezier(p0[:, 1], p1[:, 1], p2[:, 1], p3[:, 1], u)
+	linear = p0[:, 1] + (p3[:, 1] - p0[:, 1]) * (f - p0[:, 0]) / (p3[:, 0] - p0[:, 0])
+
+	segment_mode = mode[segment]
+	values[inside] = np.where(segment_mode == 0, p0[:, 1], np.where(segment_mode == 1, linear, bezier))
+
+	return values
+
+
+def Bezier(p0, p1, p2, p3, u):
+	v = 1.0 - u
+	return v * v * v * p0 + 3 * v * v * u * p1 + 3 * v * u * u * p2 + u * u * u * p3
+
+
+# Slope used by linear extrapolation - along the handle for bezier end keys, else towards the neighbouring key.
+def Extrapolation_Slope(key, neighbour, handle, mode):
+
+	if mode == FCURVE_INTERPOLATION['CONSTANT']:
+		return 0.0
+
+	if mode == FCURVE_INTERPOLATION['BEZIER']:
+		dx = key[0] - handle[0]
+		if dx != 0:
+			return (key[1] - handle[1]) / dx
+
+	dx = neighbour[0] - key[0]
+
+	return (neighbour[1] - key[1]) / dx if dx != 0 else 0.0
+
+
+# Checks of clip slicing against the track it's cut from : python xsg_export_animation_track.py
+
+def Track_Slice_Check():
+
+	# Hermite keys with broken tangents - each incoming tangent differs from the outgoing one.
+	track = Track(2)
+	track.Append_Block([0.0, 1.0, 2.0, 3.0], [[0.0, 1.0], [2.0, -1.0], [1.0, 0.5], [3.0, 2.0]])
+	track.tangents_in = np.array([[0.0, 0.0], [4.0, -2.0], [-1.0, 3.0], [2.0, 1.0]])
+	track.tangents_out = np.array([[1.0, 2.0], [-3.0, 1.0], [0.5, -2.0], [0.0, 0.0]])
+
+	# Bounds on interior keys keep those keys' tangents.
+	sliced = Track_Slice(track, 1.0, 2.0)
+	assert np.allclose(sliced.Times(), [0.0, 1.0]) and np.allclose(sliced.Values(), track.Values()[1:3])
+	assert np.allclose(sliced.tangents_out[0], track.tangents_out[1]) and np.allclose(sliced.tangents_in[-1], track.tangents_in[2])
+
+	# Bounds between keys follow the curve, with matching slopes either side.
+	bounds = np.array([0.5, 2.5])
+	sliced = Track_Slice(track, *bounds)
+	assert np.allclose(sliced.Values()[[0, -1]], Track_Evaluate(track, bounds))
+	assert np.allclose(sliced.tangents_in[[0, -1]], sliced.tangents_out[[0, -1]])
+	assert np.allclose(sliced.Values()[1:-1], track.Values()[1:3]) and np.allclose(sliced.tangents_in[1:-1], track.tangents_in[1:3])
+
+	# Slices reproduce the track over their range.
+	times = np.linspace(0.5, 2.5, 41)
+	assert np.allclose(Track_Evaluate(sliced, times - 0.5), Track_Evaluate(track, times))
+
+
+if __name__ == "__main__":
+	Track_Slice_Check()
+	print("xsg_export_animation_track : slices match their tracks")
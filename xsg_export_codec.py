@@ -0,0 +1,312 @@
+################################################################################################################################
+#
+# Copyright (c) 2023, Advance Software Limited. All rights reserved.
+#
+# Redistribution and use in source and binary forms with or without
+# modification are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL ADVANCE SOFTWARE LIMITED BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# This file : Index & vertex stream compression codec, with reference decoders.
+#
+#   encoding="delta"     : Index stream. Each index is stored as the zigzag encoded difference from the previous index
+#                          as a little endian base 128 varint.
+#
+#   encoding="triangle"  : Triangle list connectivity, in the spirit of meshoptimizer's index codec.
+#                          One code byte per triangle is followed by a varint data stream.
+#
+#                          Code byte, edge hit :  1RRVEEEE - triangle rotated R places starts with edge E of the
+#                                                 edge FIFO. V=0 : third vertex is 'next', V=1 : token in data stream.
+#                          Code byte, no hit   :  00000000 - three vertex tokens follow in the data stream.
+#
+#                          Vertex token : 0 = 'next' (the next unseen vertex), 1..16 = vertex FIFO entry,
+#                                         17+ = zigzag encoded difference from the last explicitly coded vertex.
+#
+#   encoding="byteplane" : Vertex attribute stream. Values are split into byte planes (all byte 0s, then all byte 1s, ...)
+#                          and each plane is delta encoded modulo 256 so that slowly varying data becomes runs of small
+#                          bytes which compress well.
+#
+#   Streams are written to the text format as base64.
+#
+# ------------------------------------------------------------------------------------------------------------------------------
+
+import numpy as np
+
+
+FIFO_SIZE = 16
+
+TOKEN_NEXT = 0
+TOKEN_FIFO = 1
+TOKEN_EXPLICIT = TOKEN_FIFO + FIFO_SIZE
+
+
+def Zigzag_Encode(value):
+	return (value << 1) ^ -(value < 0)
+
+
+def Zigzag_Decode(value):
+	return (value >> 1) ^ -(value & 1)
+
+
+def Varint_Write(out, value):
+	while value >= 0x80:
+		out.append((value & 0x7F) | 0x80)
+		value >>= 7
+	out.append(value)
+
+
+def Varint_Read(data, position):
+	value = 0
+	shift = 0
+
+	while True:
+		byte = data[position]
+		position += 1
+		value |= (byte & 0x7F) << shift
+		shift += 7
+
+		if byte < 0x80:
+			return value, position
+
+
+# Index streams - delta, zigzag & varint.
+
+def Index_Stream_Encode(indices):
+
+	out = bytearray()
+	last = 0
+
+	for index in indices:
+		index = int(index)
+		Varint_Write(out, Zigzag_Encode(index - last))
+		last = index
+
+	return bytes(out)
+
+
+def Index_Stream_Decode(data, count):
+
+	indices = []
+	position = 0
+	last = 0
+
+	for i in range(0, count):
+		delta, position = Varint_Read(data, position)
+		last += Zigzag_Decode(delta)
+		indices.append(last)
+
+	return indices
+
+
+# Triangle connectivity - edge & vertex FIFOs.
+
+class Triangle_Codec_State:
+	def __init__(self):
+		self.edge_fifo = []
+		self.vertex_fifo = []
+		self.next = 0
+		self.last = 0
+
+	def Edge_Find(self, a, b):
+		for index, edge in enumerate(self.edge_fifo):
+			if edge[0] == a and edge[1] == b:
+				return index
+		return -1
+
+	# Edges are pushed reversed, matching the winding of the neighbouring triangle which shares them.
+	def Triangle_Push(self, a, b, c):
+		self.edge_fifo[0:0] = [(a, c), (c, b), (b, a)]
+		del self.edge_fifo[FIFO_SIZE:]
+
+	def Vertex_Push(self, v):
+		self.vertex_fifo.insert(0, v)
+		del self.vertex_fifo[FIFO_SIZE:]
+
+	def Vertex_Token(self, v):
+		if v == self.next:
+			self.next += 1
+			self.Vertex_Push(v)
+			return TOKEN_NEXT
+
+		if v in self.vertex_fifo:
+			return TOKEN_FIFO + self.vertex_fifo.index(v)
+
+		token = TOKEN_EXPLICIT + Zigzag_Encode(v - self.last)
+		self.last = v
+		self.Vertex_Push(v)
+		return token
+
+	def Vertex_From_Token(self, token):
+		if token == TOKEN_NEXT:
+			v = self.next
+			self.next += 1
+			self.Vertex_Push(v)
+			return v
+
+		if token < TOKEN_EXPLICIT:
+			return self.vertex_fifo[token - TOKEN_FIFO]
+
+		v = self.last + Zigzag_Decode(token - TOKEN_EXPLICIT)
+		self.last = v
+		self.Vertex_Push(v)
+		return v
+
+
+def Triangles_Encode(indices):
+
+	state = Triangle_Codec_State()
+	codes = bytearray()
+	data = bytearray()
+
+	for i in range(0, len(indices) - len(indices) % 3, 3):
+
+		triangle = (int(indices[i]), int(indices[i+1]), int(indices[i+2]))
+		hit = False
+
+		for rotation in range(0, 3):
+			a = triangle[rotation]
+			b = triangle[(rotation + 1) % 3]
+			c = triangle[(rotation + 2) % 3]
+
+			edge = state.Edge_Find(a, b)
+
+			if edge >= 0:
+				token = state.Vertex_Token(c)
+
+				if token == TOKEN_NEXT:
+					codes.append(0x80 | (rotation << 5) | edge)
+				else:
+					codes.append(0x80 | (rotation << 5) | 0x10 | edge)
+					Varint_Write(data, token)
+
+				hit = True
+				break
+
+		if not hit:
+			codes.append(0)
+			for v in triangle:
+				Varint_Write(data, state.Vertex_Token(v))
+
+		state.Triangle_Push(*triangle)
+
+	return bytes(codes + data)
+
+
+def Triangles_Decode(data, count):
+
+	state = Triangle_Codec_State()
+	indices = []
+	triangle_count = count // 3
+	position = triangle_count
+
+	for i in range(0, triangle_count):
+		code = data[i]
+
+		if code & 0x80:
+			rotation = (code >> 5) & 3
+			a, b = state.edge_fifo[code & 0x0F]
+
+			if code & 0x10:
+				token, position = Varint_Read(data, position)
+			else:
+				token = TOKEN_NEXT
+
+			rotated = (a, b, state.Vertex_From_Token(token))
+
+			# Undo the rotation applied by the encoder.
+			triangle = tuple(rotated[(k - rotation) % 3] for k in range(0, 3))
+		else:
+			vertices = []
+			for k in range(0, 3):
+				token, position = Varint_Read(data, position)
+				vertices.append(state.Vertex_From_Token(token))
+			triangle = tuple(vertices)
+
+		state.Triangle_Push(*triangle)
+		indices.extend(triangle)
+
+	return indices
+
+
+# Vertex attribute streams - byte plane delta filter.
+
+def Byte_Plane_Delta_Encode(values):
+
+	values = np.ascontiguousarray(values)
+	count = values.shape[0]
+	stride = values.dtype.itemsize * int(np.prod(values.shape[1:], dtype=np.int64))
+
+	planes = values.view(np.uint8).reshape(count, stride).T.copy()
+
+	# uint8 arithmetic wraps, giving deltas modulo 256.
+	planes[:, 1:] = planes[:, 1:] - planes[:, :-1]
+
+	return planes.tobytes()
+
+
+def Byte_Plane_Delta_Decode(data, dtype, shape):
+
+	dtype = np.dtype(dtype)
+	count = shape[0]
+	stride = dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64))
+
+	planes = np.frombuffer(data, dtype=np.uint8).reshape(stride, count)
+	planes = np.cumsum(planes, axis=1, dtype=np.uint8)
+
+	return np.ascontiguousarray(planes.T).view(dtype).reshape(shape)
+
+
+# Round trip checks of every encoding against its reference decoder : python xsg_export_codec.py
+
+def Round_Trip_Check():
+
+	rng = np.random.default_rng(0)
+
+	# Triangle lists - empty, a single triangle, a grid with shared edges & random connectivity.
+	grid = []
+	for y in range(0, 15):
+		for x in range(0, 15):
+			a = y * 16 + x
+			grid += [a, a + 1, a + 16, a + 1, a + 17, a + 16]
+
+	triangle_lists = [[], [0, 1, 2], [5, 3, 9], grid, rng.integers(0, 300, 3 * 500).tolist()]
+
+	for indices in triangle_lists:
+		assert Triangles_Decode(Triangles_Encode(indices), len(indices)) == indices
+
+	# Index streams - empty, single, ascending, descending & large jumps.
+	index_lists = [[], [0], [7], list(range(0, 100)), list(range(100, 0, -1)), [0, 1 << 20, 3, (1 << 31) - 1, 0], rng.integers(0, 1 << 16, 1000).tolist()]
+
+	for indices in index_lists:
+		assert Index_Stream_Decode(Index_Stream_Encode(indices), len(indices)) == indices
+
+	# Byte plane filter - empty, single row & multi byte component types.
+	arrays = [np.zeros((0, 3), dtype=np.float32), np.array([[1.5, -2.0, 3.25]], dtype=np.float32),
+		rng.normal(size=(1000, 3)).astype(np.float32), rng.integers(0, 1 << 16, (500, 2)).astype(np.uint16),
+		rng.integers(0, 256, (300, 2)).astype(np.uint8), rng.normal(size=(50,))]
+
+	for values in arrays:
+		decoded = Byte_Plane_Delta_Decode(Byte_Plane_Delta_Encode(values), values.dtype, values.shape)
+		assert decoded.dtype == values.dtype and decoded.shape == values.shape
+		assert decoded.tobytes() == values.tobytes()
+
+
+if __name__ == "__main__":
+	Round_Trip_Check()
+	print("xsg_export_codec : all round trips exact")
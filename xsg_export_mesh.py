@@ -45,12 +45,18 @@
 
 
 import bpy
+import base64
+import numpy as np
 
 from mathutils import Vector, Matrix
 from itertools import repeat
 
 from .util import Util
 from .xsg_export_base import Export_Base
+from .xsg_export_quantize import Quantize_Range, Octahedral_Encode, Quantized_Remove_Duplicates
+from .xsg_export_codec import Index_Stream_Encode, Triangles_Encode, Byte_Plane_Delta_Encode
+from .xsg_export_skinning import Skin_Offsets, Skin_Weights_Filter, Skin_Weights_Limit, Skin_Weights_Normalize, Skin_Weights_Quantize, Skin_Influence_Vertices, \
+	Skin_Vertices_Duplicate, Skin_Palettes_Partition, Skin_Weights_Pack, Skin_Palette_Slots
 
 
 # Notes :
@@ -105,6 +111,38 @@ def Find_Sorted(key, seq):
 	
 
 		
+# Gather the vertex group memberships of all mesh vertices into CSR arrays (offsets, groups, weights) - see xsg_export_skinning.
+# Blender has no whole mesh accessor for memberships, so this is a single Python pass over every vertex & membership, costing
+# roughly what the per vertex weight loop it replaced did. Everything after it works on the arrays.
+
+def Vertex_Groups_Collect(mesh):
+
+	counts = np.empty(len(mesh.vertices), dtype=np.int64)
+	groups = []
+	weights = []
+	
+	for index, vertex in enumerate(mesh.vertices):
+		vertex_groups = vertex.groups
+		counts[index] = len(vertex_groups)
+		
+		for element in vertex_groups:
+			groups.append(element.group)
+			weights.append(element.weight)
+			
+	return Skin_Offsets(counts), np.array(groups, dtype=np.int32), np.array(weights, dtype=np.float32)
+	
+
+# Sparse shape key offsets - the vertices target moves more than threshold from basis, & their offsets.
+# Returns (indices, deltas).
+
+def Morph_Deltas_Sparse(basis, target, threshold):
+
+	deltas = target - basis
+	indices = np.flatnonzero((deltas * deltas).sum(axis=1) > threshold * threshold)
+	
+	return indices, deltas[indices]
+	
+
 # Mesh implementation of Export_Base
 class Export_Mesh(Export_Base):
 	def __init__(self, exporter, blender_object):
@@ -143,6 +181,15 @@ class Export_Mesh(Export_Base):
 				bpy.ops.object.editmode_toggle()
 				was_edit_mode = True
 
+		# Morph targets are offsets from the basis shape, so pin the basis while the mesh is generated to keep the current
+		# shape key weights out of it.
+		pinned_shape = None
+		
+		if self.exporter.config.export_morphs and self.blender_object.data.shape_keys is not None:
+			pinned_shape = (self.blender_object.show_only_shape_key, self.blender_object.active_shape_key_index)
+			self.blender_object.show_only_shape_key = True
+			self.blender_object.active_shape_key_index = 0
+
 		if self.exporter.config.apply_modifiers:
 			
 			# Certain modifiers shouldn't be applied in some cases.  Deactivate them until after mesh generation is complete
@@ -176,6 +223,9 @@ class Export_Mesh(Export_Base):
 			self.blender_object.to_mesh_clear()
 			
 		
+		if pinned_shape is not None:
+			self.blender_object.show_only_shape_key, self.blender_object.active_shape_key_index = pinned_shape
+		
 		# Switch back to edit mode if we toggled out of it to grab mesh data.
 		if was_edit_mode :
 			bpy.ops.object.editmode_toggle()
@@ -200,6 +250,15 @@ class Export_Mesh(Export_Base):
 				self.vertex_normals = []
 				self.polygons = []
 				self.next_index = 0
+				self.quantized = False
+				
+				# Bone palette batches per (material index, quads) & the source vertex of each duplicated position.
+				self.batches = None
+				self.position_duplicates = np.zeros(0, dtype=np.int64)
+				
+				# Palette of each batch & batch of each position (including duplicates), -1 for positions in no face.
+				self.palettes = []
+				self.vertex_batches = None
 		
 			def CollectVertexData(self, mesh, bobj, exp):
 			
@@ -358,187 +417,299 @@ class Export_Mesh(Export_Base):
 				wm.progress_end()
 					
 					
-			def WriteConnectivity_NonQuad(self, exp, material_index):
+			def Quantize(self, mesh, exp):
 			
-				# Write face vertex indices matching this material_index, 
-				# triangulating non-quad n-gons as is necessary for the current version of xsg.	
+				# Replace the float attribute tables with quantized equivalents. Normals & texture coordinates which become 
+				# identical once quantized are merged, so polygon indices are remapped to the reduced tables.
+				
+				position_bits = 16
+				texture_bits = 16
+				normal_bits = int(exp.config.quantize_normal_bits)
+				
+				# Positions - converting from Blender coord system to xsg.
+				positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+				mesh.vertices.foreach_get("co", positions)
+				positions = positions.reshape(-1, 3)[:, (0, 2, 1)]
+				
+				self.quantized_positions, self.position_offset, self.position_scale, position_error = Quantize_Range(positions, position_bits)
+				
+				# Normals - converting coordinate system.
+				normals = np.array([(n[0], n[2], n[1]) for n in self.vertex_normals], dtype=np.float64).reshape(-1, 3)
+				encoded, normal_error = Octahedral_Encode(normals, normal_bits)
+				self.quantized_normals, normal_remap = Quantized_Remove_Duplicates(encoded)
+				self.normal_bits = normal_bits
+				
+				# Texture coordinates.
+				self.quantized_texture_coordinates = []
+				texture_remaps = []
+				texture_errors = []
+				
+				for tcoords in self.texture_coordinates:
+					values = np.array([(t[0], t[1]) for t in tcoords], dtype=np.float64).reshape(-1, 2)
+					quantized, offset, scale, error = Quantize_Range(values, texture_bits)
+					quantized, remap = Quantized_Remove_Duplicates(quantized)
+					self.quantized_texture_coordinates.append((quantized, offset, scale))
+					texture_remaps.append(remap)
+					texture_errors.append(error)
+				
+				for poly in self.polygons:
+					poly.normal_indices = [int(normal_remap[i]) for i in poly.normal_indices]
+					
+					for t, remap in enumerate(texture_remaps):
+						poly.texture_indices[t] = [int(remap[i]) for i in poly.texture_indices[t]]
+				
+				self.quantized = True
+				
+				exp.Log("Quantize : position {} bit, max error {:f}".format(position_bits, position_error))
+				exp.Log("Quantize : normal 2x{} bit, {} -> {} entries, max error {:f} degrees".format(normal_bits, len(self.vertex_normals), len(self.quantized_normals), normal_error))
+				
+				for t, error in enumerate(texture_errors):
+					exp.Log("Quantize : texture[{}] {} bit, {} -> {} entries, max error {:f}".format(t, texture_bits, len(self.texture_coordinates[t]), len(self.quantized_texture_coordinates[t][0]), error))
+					
+					
+			def Faces_Collect(self, exp, material_index, quads):
+			
+				# Gather position, normal & texture index streams of faces matching this material_index - either quads or
+				# all other n-gons, triangulated as is necessary for the current version of xsg.
 				# When this extends, convex n-gons only. Split any concave ngons.
 				
-				found = False
+				num_tex_coord_sets = len(mesh.uv_layers)
+				
+				if num_tex_coord_sets > exp.config.max_tcoord_channels_to_export:
+					num_tex_coord_sets = exp.config.max_tcoord_channels_to_export
+				
+				position = []
+				normal = []
+				texture = [[] for i in repeat(None, num_tex_coord_sets)]
 				
-				# position
-
 				for poly in self.polygons :
 				
 					if poly.material_index != material_index : continue
 						
 					nvertices = len(poly.vertex_indices)
 
-               # Ignore disconnected edges & points.
+					# Ignore disconnected edges & points.
 					if nvertices < 3 : continue
 					
-               # Quads are processed seperately.
-					if nvertices == 4 : continue
-						
-					if found != True:
-						found = True
-						exp.file.Write('<faces size=3>\n')
-						exp.file.Indent()
-						exp.file.Write('<position>')
+					# Quads are processed seperately.
+					if (nvertices == 4) != quads : continue
 					
-					exp.file.Write("{} {} {}  ".format(poly.vertex_indices[0], poly.vertex_indices[1], poly.vertex_indices[2]), Indent=False)
+					streams = [(position, poly.vertex_indices), (normal, poly.normal_indices)]
+					
+					if len(self.texture_coordinates) > 0 :
+						streams += [(texture[t], poly.texture_indices[t]) for t in range(0, num_tex_coord_sets)]
+					
+					for dest, indices in streams :
 						
-					# triangulate n-gons. 
-					for i in range(3, nvertices): 
-						exp.file.Write("{} {} {}  ".format(poly.vertex_indices[i], poly.vertex_indices[0], poly.vertex_indices[i-1]), Indent=False)
-
-				if found:
-					exp.file.Write("</position>\n", Indent=False)
+						if quads:
+							dest.extend(indices[0:4])
+							continue
+							
+						dest.extend(indices[0:3])
+						
+						# triangulate n-gons. 
+						for i in range(3, nvertices): 
+							dest.extend((indices[i], indices[0], indices[i-1]))
+				
+				if len(self.texture_coordinates) == 0 :
+					texture = []
+				
+				return position, normal, texture
 				
+				
+			def Palettes_Split(self, mesh, exp, skin, palette_size):
 			
-				if found:
-
-					# normal
+				# Partition each material's faces into batches whose bones fit the palette. A vertex used by more than
+				# one batch is duplicated for each further batch so that it can carry palette relative bone indices.
+				
+				vertex_batch = np.full(len(mesh.vertices), -1, dtype=np.int64)
+				duplicates = []
+				duplicate_batches = []
+				position_count = len(mesh.vertices)
+				batch_count = 0
 				
-					exp.file.Write('<normal>')
+				self.batches = {}
 				
-					for poly in self.polygons :
+				for material_index in range(0, max(len(mesh.materials), 1)):
+					for quads in (True, False):
+					
+						position, normal, texture = self.Faces_Collect(exp, material_index, quads)
 						
-						if poly.material_index != material_index : continue
-							
-						nvertices = len(poly.normal_indices)
+						if len(position) == 0 : continue
 						
-						if nvertices == 4 : continue
-
-						exp.file.Write("{} {} {}  ".format(poly.normal_indices[0], poly.normal_indices[1], poly.normal_indices[2]), Indent=False)
+						size = 4 if quads else 3
+						faces = np.array(position, dtype=np.int64).reshape(-1, size)
 						
-						# triangulate n-gons. 
-						# TODO: have only tested quads. might need tweaking to support higher n-gons.
-						for i in range(3, nvertices): 
-							exp.file.Write("{} {} {}  ".format(poly.normal_indices[i], poly.normal_indices[0], poly.normal_indices[i-1]), Indent=False)
-
-					exp.file.Write("</normal>\n", Indent=False)
-				
-					# texture coordinates
-
-					if len(self.texture_coordinates) > 0 :
-					
-						num_tex_coord_sets = len(mesh.uv_layers)
+						face_batches, palettes, oversized = Skin_Palettes_Partition(faces, skin.offsets, skin.influences, palette_size)
 						
-						if num_tex_coord_sets > exp.config.max_tcoord_channels_to_export:
-							num_tex_coord_sets = exp.config.max_tcoord_channels_to_export						
+						if oversized > 0:
+							exp.Log("Skinning : {} faces of material {} use more than {} bones".format(oversized, material_index, palette_size))
 						
-						for t in range(0, num_tex_coord_sets): 
-					
-							exp.file.Write('<texture>')
+						batches = []
+						
+						for batch, palette in enumerate(palettes):
+						
+							selected = face_batches == batch
+							batch_faces = faces[selected]
 							
-							for poly in self.polygons :
-								
-								if poly.material_index != material_index : continue
-								
-								texture_indices = poly.texture_indices[t]
-								
-								nvertices = len(texture_indices)
-
-								if nvertices == 4 : continue
+							# Claim unowned vertices for this batch & duplicate those already owned by another.
+							used = np.unique(batch_faces)
+							vertex_batch[used[vertex_batch[used] == -1]] = batch_count
+							shared = used[vertex_batch[used] != batch_count]
+							
+							if len(shared) > 0:
+								duplicates.append(shared)
+								duplicate_batches.append(np.full(len(shared), batch_count, dtype=np.int64))
+								slots = np.searchsorted(shared, batch_faces)
+								is_shared = shared[np.minimum(slots, len(shared) - 1)] == batch_faces
+								batch_faces = np.where(is_shared, position_count + slots, batch_faces)
+								position_count += len(shared)
+							
+							batches.append((palette, batch_faces.reshape(-1).tolist(),
+								np.array(normal).reshape(-1, size)[selected].reshape(-1).tolist(),
+								[np.array(indices).reshape(-1, size)[selected].reshape(-1).tolist() for indices in texture]))
 								
-								exp.file.Write("{} {} {}  ".format(texture_indices[0], texture_indices[1], texture_indices[2]), Indent=False)
-									
-								# triangulate n-gons. 
-								for i in range(3, nvertices): 
-									exp.file.Write("{} {} {}  ".format(texture_indices[i], texture_indices[0], texture_indices[i-1]), Indent=False)
-
-							exp.file.Write("</texture>\n", Indent=False)
+							self.palettes.append(palette)
+							batch_count += 1
+							
+						self.batches[(material_index, quads)] = batches
 						
-					exp.file.Unindent()
-					exp.file.Write("</faces>\n")										
-
-			
-			def WriteConnectivity_Quad(self, exp, material_index):
+				self.vertex_batches = np.concatenate([vertex_batch] + duplicate_batches)
+				
+				if len(duplicates) > 0:
+					self.position_duplicates = np.concatenate(duplicates)
+					
+					if self.quantized:
+						self.quantized_positions = np.concatenate((self.quantized_positions, self.quantized_positions[self.position_duplicates]))
+				
+				exp.Log("Skinning : {} batches of at most {} bones, {} vertices duplicated".format(batch_count, palette_size, len(self.position_duplicates)))
+				
+				
+			def Positions_Collect(self, mesh):
 			
-				# Write quad face vertex indices matching this material_index
+				# Vertex positions including palette duplicates - converting from Blender coord system to xsg.
+				
+				positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+				mesh.vertices.foreach_get("co", positions)
+				positions = positions.reshape(-1, 3)[:, (0, 2, 1)]
 				
-				found = 0
+				return np.concatenate((positions, positions[self.position_duplicates]))
 				
-				found = False;
 				
-				# position
+			def Index_Stream_Write(self, exp, tag, indices, size, triangles=False):
 			
-				for poly in self.polygons :
-					
-					if poly.material_index != material_index : continue
+				if exp.config.compress_streams:
+					if triangles:
+						encoding = "triangle"
+						payload = Triangles_Encode(indices)
+					else:
+						encoding = "delta"
+						payload = Index_Stream_Encode(indices)
 						
-					nvertices = len(poly.vertex_indices)
-
-					if nvertices != 4 : continue
-						
-					if found != True :
-						found = True
-						exp.file.Write('<faces size=4>\n')
-						exp.file.Indent()
-						exp.file.Write('<position>')
-								
-					exp.file.Write("{} {} {} {}  ".format(poly.vertex_indices[0], poly.vertex_indices[1], poly.vertex_indices[2], poly.vertex_indices[3]), Indent=False)
+					exp.file.Write('<{} encoding="{}" count="{}">'.format(tag, encoding, len(indices)))
+					exp.file.Write(base64.b64encode(payload).decode('ascii'), Indent=False)
+				else:
+					exp.file.Write('<{}>'.format(tag))
 					
-				if found:
-					exp.file.Write("</position>\n", Indent=False)
+					face_format = "{} " * size + " "
+					
+					for i in range(0, len(indices), size):
+						exp.file.Write(face_format.format(*indices[i:i+size]), Indent=False)
+						
+				exp.file.Write('</{}>\n'.format(tag), Indent=False)
 				
 				
-				# normal
-				if found:
-					exp.file.Write('<normal>')
-						
-					for poly in self.polygons :
-					
-						if poly.material_index != material_index : continue
-
-						nvertices = len(poly.normal_indices)
-
-						if nvertices != 4 : continue
-							
-						exp.file.Write("{} {} {} {}  ".format(poly.normal_indices[0], poly.normal_indices[1], poly.normal_indices[2], poly.normal_indices[3]), Indent=False)
-
-					exp.file.Write("</normal>\n", Indent=False)
+			def WriteConnectivity(self, exp, material_index, quads):
+			
+				# Write face vertex indices matching this material_index - one faces element per bone palette batch
+				# when split.
+				
+				if self.batches is not None:
+					for palette, position, normal, texture in self.batches.get((material_index, quads), []):
+						self.Faces_Write(exp, quads, position, normal, texture, palette)
+					return
+				
+				position, normal, texture = self.Faces_Collect(exp, material_index, quads)
+				
+				if len(position) == 0 : return
 				
+				self.Faces_Write(exp, quads, position, normal, texture)
 				
-				# texture
+				
+			def Faces_Write(self, exp, quads, position, normal, texture, palette=None):
+			
+				size = 4 if quads else 3
+				
+				exp.file.Write('<faces size={}>\n'.format(size))
+				exp.file.Indent()
+				
+				# Palette slot -> influence index, in influence write order. Skinning indices within these faces are
+				# relative to the palette.
+				if palette is not None:
+					exp.file.Write('<palette>{}</palette>\n'.format(" ".join(map(str, palette.tolist()))))
+				
+				self.Index_Stream_Write(exp, "position", position, size, triangles=not quads)
+				self.Index_Stream_Write(exp, "normal", normal, size)
+				
+				for indices in texture:
+					self.Index_Stream_Write(exp, "texture", indices, size)
 					
-				if len(self.texture_coordinates) > 0 :
+				exp.file.Unindent()
+				exp.file.Write("</faces>\n")
+				
+				
+			def Attribute_Stream_Write(self, exp, tag, values, attributes=""):
+				values = np.ascontiguousarray(values)
+				exp.file.Write('<{} encoding="byteplane" type="{}" count="{}"{}>'.format(tag, values.dtype.name, len(values), attributes))
+				exp.file.Write(base64.b64encode(Byte_Plane_Delta_Encode(values)).decode('ascii'), Indent=False)
+				exp.file.Write('</{}>\n'.format(tag), Indent=False)
+				
 				
-					if found:
+			def Write_Vertex_Streams_Compressed(self, exp):
+			
+				# Write vertex attribute tables as byte plane filtered binary streams - converting coordinate system.
+				
+				if self.quantized:
+					self.Attribute_Stream_Write(exp, "position", self.quantized_positions.astype(np.uint16), 
+						' quantize="16" offset="{:.9g} {:.9g} {:.9g}" scale="{:.9g} {:.9g} {:.9g}"'.format(*self.position_offset, *self.position_scale))
 					
-						num_tex_coord_sets = len(mesh.uv_layers)
-						
-						if num_tex_coord_sets > exp.config.max_tcoord_channels_to_export:
-							num_tex_coord_sets = exp.config.max_tcoord_channels_to_export
+					if len(self.quantized_normals) > 0 :
+						self.Attribute_Stream_Write(exp, "normal", self.quantized_normals.astype(np.uint8 if self.normal_bits == 8 else np.uint16),
+							' octahedral="{}"'.format(self.normal_bits))
+				else:
+					self.Attribute_Stream_Write(exp, "position", self.Positions_Collect(mesh))
+					
+					if len(self.vertex_normals) > 0 :
+						self.Attribute_Stream_Write(exp, "normal", np.array([(n[0], n[2], n[1]) for n in self.vertex_normals], dtype=np.float32))
+				
+				num_tex_coord_sets = len(self.texture_coordinates)
+				
+				if num_tex_coord_sets > exp.config.max_tcoord_channels_to_export:
+					num_tex_coord_sets = exp.config.max_tcoord_channels_to_export
+				
+				for t in range(0, num_tex_coord_sets) :
+					if self.quantized:
+						quantized, offset, scale = self.quantized_texture_coordinates[t]
+						self.Attribute_Stream_Write(exp, "texture", quantized.astype(np.uint16),
+							' quantize="16" offset="{:.9g} {:.9g}" scale="{:.9g} {:.9g}"'.format(offset[0], offset[1], scale[0], scale[1]))
+					else:
+						self.Attribute_Stream_Write(exp, "texture", np.array([(tc.x, tc.y) for tc in self.texture_coordinates[t]], dtype=np.float32).reshape(-1, 2))
 						
-						for t in range(0, num_tex_coord_sets): 
-
-							exp.file.Write('<texture>')
-							
-							for poly in self.polygons :
-								
-								if poly.material_index != material_index : continue
-								
-								texture_indices = poly.texture_indices[t]
-
-								nvertices = len(texture_indices)
-								
-								if nvertices != 4 : continue
-								
-								exp.file.Write("{} {} {} {}  ".format(texture_indices[0], texture_indices[1], texture_indices[2], texture_indices[3]), Indent=False)
-							
-							exp.file.Write("</texture>\n", Indent=False)
-
-				if found:
-					exp.file.Unindent()
-					exp.file.Write("</faces>\n")										
-
 				
 			def Write_Vertex_Normals(self, exp):
 
 				# Write vertex normals - converting coordinate system.
 				
+				if self.quantized:
+					if len(self.quantized_normals) > 0 :
+						exp.file.Write('<normal octahedral="{}">'.format(self.normal_bits))
+						
+						for n in self.quantized_normals :
+							exp.file.Write("{} {}  ".format(n[0], n[1]), Indent=False)
+							
+						exp.file.Write("</normal>\n", Indent=False)
+					return
+				
 				if (len(self.vertex_normals) > 0) :
 					exp.file.Write("<normal>")
 				
@@ -551,39 +722,54 @@ class Export_Mesh(Export_Base):
 			def Connectivity_Write(self, exp, mtl_name, material_index):
 				exp.file.Write('<material id="{}">\n'.format(mtl_name))
 				exp.file.Indent()
-				self.WriteConnectivity_Quad(exp, material_index)
-				self.WriteConnectivity_NonQuad(exp, material_index)
+				self.WriteConnectivity(exp, material_index, quads=True)
+				self.WriteConnectivity(exp, material_index, quads=False)
 				exp.file.Unindent()
 				exp.file.Write('</material>\n')					
 
 			
 			def Write(self, exp):
 
-				# Write vertex positions - converting from Blender coord system to xsg.
+				if exp.config.compress_streams:
+					self.Write_Vertex_Streams_Compressed(exp)
+				else:
+					# Write vertex positions - converting from Blender coord system to xsg.
 				
-				exp.file.Write("<position>")	
-				for v in mesh.vertices :
-					exp.file.Write("{:f} {:f} {:f}  ".format(v.co.x, v.co.z, v.co.y), Indent=False)
+					if self.quantized:
+						exp.file.Write('<position quantize="16" offset="{:.9g} {:.9g} {:.9g}" scale="{:.9g} {:.9g} {:.9g}">'.format(*self.position_offset, *self.position_scale))
+						for v in self.quantized_positions :
+							exp.file.Write("{} {} {}  ".format(v[0], v[1], v[2]), Indent=False)
+					else:
+						exp.file.Write("<position>")	
+						for v in self.Positions_Collect(mesh).tolist() :
+							exp.file.Write("{:f} {:f} {:f}  ".format(v[0], v[1], v[2]), Indent=False)
 					
-				exp.file.Write("</position>\n", Indent=False)
+					exp.file.Write("</position>\n", Indent=False)
 
-				self.Write_Vertex_Normals(exp)
+					self.Write_Vertex_Normals(exp)
 			
-				# Write texture coordinates
+					# Write texture coordinates
 				
-				num_tex_coord_sets = len(self.texture_coordinates)
+					num_tex_coord_sets = len(self.texture_coordinates)
 				
-				if num_tex_coord_sets > exp.config.max_tcoord_channels_to_export:
-					num_tex_coord_sets = exp.config.max_tcoord_channels_to_export
+					if num_tex_coord_sets > exp.config.max_tcoord_channels_to_export:
+						num_tex_coord_sets = exp.config.max_tcoord_channels_to_export
 				
-				for t in range(0, num_tex_coord_sets) :
+					for t in range(0, num_tex_coord_sets) :
 
-					exp.file.Write("<texture>")
-					
-					for t in self.texture_coordinates[t]:
-						exp.file.Write("{:f} {:f}  ".format(t.x, t.y), Indent=False)
+						if self.quantized:
+							quantized, offset, scale = self.quantized_texture_coordinates[t]
+							exp.file.Write('<texture quantize="16" offset="{:.9g} {:.9g}" scale="{:.9g} {:.9g}">'.format(offset[0], offset[1], scale[0], scale[1]))
+						
+							for q in quantized:
+								exp.file.Write("{} {}  ".format(q[0], q[1]), Indent=False)
+						else:
+							exp.file.Write("<texture>")
+						
+							for t in self.texture_coordinates[t]:
+								exp.file.Write("{:f} {:f}  ".format(t.x, t.y), Indent=False)
 
-					exp.file.Write("</texture>\n", Indent=False)
+						exp.file.Write("</texture>\n", Indent=False)
 				
 				counter=1
 				
@@ -614,14 +800,28 @@ class Export_Mesh(Export_Base):
 		
 		self.exporter.Log("Convert ...")
 		export_mesh.Convert(mesh, self.exporter)
+		
+		if self.exporter.config.quantize_attributes:
+			self.exporter.Log("Quantize ...")
+			export_mesh.Quantize(mesh, self.exporter)
 	
 		self.exporter.Log("Write ...")
 		self.exporter.file.Write("<mesh>\n")
 		self.exporter.file.Indent()
 
-		self.Modifier_Skinning_Write(mesh, export_mesh)
+		skins = self.Modifier_Skinning_Convert(mesh)
+		
+		# Split faces into batches within the bone palette limit of GPU skinning. Only one armature per mesh is supported.
+		if self.exporter.config.skin_palette_size > 0 and len(skins) > 0:
+			self.exporter.Log("Palettes_Split ...")
+			export_mesh.Palettes_Split(mesh, self.exporter, skins[0], self.exporter.config.skin_palette_size)
+
+		self.Modifier_Skinning_Write(skins, export_mesh)
 		export_mesh.Write(self.exporter)
 		
+		if self.exporter.config.export_morphs:
+			self.Morphs_Write(mesh, export_mesh)
+		
 		# TODO: port		
 		#self.Mesh_WriteVertexColours(mesh)
 			
@@ -631,9 +831,10 @@ class Export_Mesh(Export_Base):
 		self.exporter.Log("ok")
 
 	
-	def Modifier_Skinning_Write(self, mesh, xmesh):
+	def Modifier_Skinning_Convert(self, mesh):
 		# A cluster contains vertex indices and weights for the vertices that this influence affects.
 		# Also calculates the skin_to_influence transform at the time the skin was applied.
+		# A skin holds the clusters of one armature with per vertex influences in CSR form - see xsg_export_skinning.
 		
 		def matrix_difference(mat_src, mat_dst):
 			mat_dst_inv = mat_dst.inverted()
@@ -644,8 +845,8 @@ class Export_Mesh(Export_Base):
 					self.influence_id = influence_id
 					self.name = Util.SafeName(influence_id)
 					
-					self.source_vertex_indices = []
-					self.weights = []
+					self.source_vertex_indices = np.zeros(0, dtype=np.int64)
+					self.weights = np.zeros(0)
 					
 					bone = blender_armature.data.bones[influence_id]
 					
@@ -674,14 +875,26 @@ class Export_Mesh(Export_Base):
 					# In Blunder, transforms are evaluated right to left.
 					self.skin_to_influence = armature_to_influence @ world_to_armature @ skinned_mesh_to_world
 					
-				def AddVertex(self, index, weight):
-					self.source_vertex_indices.append(index)
-					self.weights.append(weight)
+		class Skin:
+				def __init__(self, clusters, offsets, influences, weights, weight_bits):
+					self.clusters = clusters
+					self.offsets = offsets
+					self.influences = influences
+					self.weights = weights
+					self.weight_bits = weight_bits
+					
 		
 
 		# Although multiple armature objects are gathered, only one armature per mesh is supported.
 
 		blender_armatures = Util.Modifier_Armatures_Collect(self.blender_object)
+		skins = []
+		
+		if len(blender_armatures) == 0:
+			return skins
+			
+		# Vertex group memberships, gathered once for all armatures.
+		vertex_offsets, vertex_groups, vertex_weights = Vertex_Groups_Collect(mesh)
 		
 		for blender_armature in blender_armatures:
 		
@@ -689,52 +902,87 @@ class Export_Mesh(Export_Base):
 			if not blender_armature:
 				continue
 				
-			# Determine the names of the skinning influence clusters.
-			pose_influence_ids = [bone.name for bone in blender_armature.pose.bones]
-			cluster_names = [group.name for group in self.blender_object.vertex_groups]
-			used_influence_ids = set(pose_influence_ids).intersection(cluster_names)
+			# Determine the names of the skinning influence clusters, in vertex group order.
+			pose_influence_ids = set(bone.name for bone in blender_armature.pose.bones)
+			used_influence_ids = [group.name for group in self.blender_object.vertex_groups if group.name in pose_influence_ids]
 			
 			# Create a skinning cluster for each influence (bone).
 			skinning_clusters = [Cluster(self.blender_object,
 				blender_armature, influence_id) for influence_id in used_influence_ids]
 			
 			# Map Blender's internal group indexing to clusters.
-			group_index_to_skinning_clusters = {group.index : cluster
-				for group in self.blender_object.vertex_groups
-				for cluster in skinning_clusters
-				if group.name == cluster.influence_id}
-			
-			maximum_influences_per_vertex = 0
-			
-			for index, vertex in enumerate(mesh.vertices):
-				vertex_weight_total = 0.0
-				vertex_influences = 0
-				
-				# Sum up the weights of groups that correspond to skin influences.
-				for vertex_group in vertex.groups:
-					cluster = group_index_to_skinning_clusters.get(vertex_group.group)
-					if cluster is not None:
-						vertex_weight_total += vertex_group.weight
-						vertex_influences += 1
-				
-				if vertex_influences > maximum_influences_per_vertex:
-					maximum_influences_per_vertex = vertex_influences
-				
-				# Add the vertex to the cluster it belongs to, normalizing each contribution's weight.
-				for vertex_group in vertex.groups:
-					cluster = group_index_to_skinning_clusters.get(vertex_group.group)
-					if cluster is not None:
-						weight = vertex_group.weight / vertex_weight_total
-						cluster.AddVertex(index, weight)
+			influence_index = {influence_id : index for index, influence_id in enumerate(used_influence_ids)}
+			group_to_influence = np.full(len(self.blender_object.vertex_groups), -1, dtype=np.int64)
+			
+			for group in self.blender_object.vertex_groups:
+				group_to_influence[group.index] = influence_index.get(group.name, -1)
+			
+			offsets, influences, weights = Skin_Weights_Filter(vertex_offsets, vertex_groups, vertex_weights, group_to_influence)
+			
+			maximum_influences_per_vertex = int(np.diff(offsets).max()) if len(offsets) > 1 else 0
+			
+			# Drop the weakest influences of vertices with too many, for the benefit of run-time skinning cost.
+			max_influences = self.exporter.config.skin_max_influences
+			
+			if max_influences > 0 and maximum_influences_per_vertex > max_influences:
+				entry_count = len(weights)
+				offsets, influences, weights = Skin_Weights_Limit(offsets, influences, weights, max_influences)
+				self.exporter.Log("Skinning : {} influences per vertex -> {}, {} of {} weights dropped".format(maximum_influences_per_vertex, 
+					int(np.diff(offsets).max()), entry_count - len(weights), entry_count))
+				maximum_influences_per_vertex = int(np.diff(offsets).max())
+			else:
+				self.exporter.Log("Skinning : {} influences per vertex".format(maximum_influences_per_vertex))
+			
+			# Normalize each vertex's contributions.
+			weights = Skin_Weights_Normalize(offsets, weights)
+			
+			weight_bits = 0 if self.exporter.config.skin_weight_bits == 'FLOAT' else int(self.exporter.config.skin_weight_bits)
+			
+			if weight_bits:
+				weights, weight_error = Skin_Weights_Quantize(offsets, weights, weight_bits)
+				self.exporter.Log("Skinning : weights {} bit, max error {:f}".format(weight_bits, weight_error))
+			
+			skins.append(Skin(skinning_clusters, offsets, influences, weights, weight_bits))
+			
+		return skins
+		
+		
+	def Modifier_Skinning_Write(self, skins, xmesh):
+	
+		for skin in skins:
+		
+			skinning_clusters = skin.clusters
+			weight_bits = skin.weight_bits
+			
+			# Vertices duplicated by bone palette splitting are skinned as their source vertex.
+			offsets, influences, weights = Skin_Vertices_Duplicate(skin.offsets, skin.influences, skin.weights, xmesh.position_duplicates)
+			
+			packed = self.exporter.config.skinning_layout == 'VERTEX'
+			
+			# Add the vertices to the clusters they belong to.
+			if not packed:
+				vertices, cluster_weights, starts = Skin_Influence_Vertices(offsets, influences, weights, len(skinning_clusters))
+			
+				for index, cluster in enumerate(skinning_clusters):
+					cluster.source_vertex_indices = vertices[starts[index]:starts[index+1]]
+					cluster.weights = cluster_weights[starts[index]:starts[index+1]]
 			
 			# TODO: fixup following xsg upgrade to add modifier layer. Drops straight into mesh for current spec.
 			#self.exporter.file.Write('<modifier type="skin" ',)
-			#self.exporter.file.Write('vmax="{}" '.format(maximum_influences_per_vertex), Indent=False)
+			#self.exporter.file.Write('vmax="{}" '.format(int(np.diff(offsets).max())), Indent=False)
 			#self.exporter.file.Write(' total="{}"'.format(len(skinning_clusters)), Indent=False)
 			#self.exporter.file.Write(">\n", Indent=False)
 			#self.exporter.file.Indent()
 			
 			for cluster in skinning_clusters:
+			
+				# The packed layout carries vertices & weights in the skin streams, so influences are just transforms.
+				if packed:
+					self.exporter.file.Write('<influence id="{}"'.format(cluster.name))
+					Util.Transform_Write(self.exporter.file, self.exporter.Transform_Convert(cluster.skin_to_influence))
+					self.exporter.file.Write("/>\n", Indent=False)
+					continue
+					
 				self.exporter.file.Write('<influence id="{}'.format(cluster.name))
 				
 				group_vertex_count = len(cluster.source_vertex_indices)
@@ -749,36 +997,157 @@ class Export_Mesh(Export_Base):
 								
 				# Write the indices of the vertices this influence affects.
 				self.exporter.file.Write('<vertex>')
-				
-				for index, vertex_index in enumerate(cluster.source_vertex_indices):
-					
-					self.exporter.file.Write("{}".format(vertex_index), Indent=False)
-					
-					if index != group_vertex_count - 1:
-						self.exporter.file.Write(" ", Indent=False)
-				
+				self.exporter.file.Write(" ".join(map(str, cluster.source_vertex_indices.tolist())), Indent=False)
 				self.exporter.file.Write('</>\n', Indent=False)
 						
-				self.exporter.file.Write('<weight>')
-				
-				# Write weight for each the affected vertex
-				for index, vertex_index in enumerate(cluster.source_vertex_indices):
-				
-					self.exporter.file.Write("{:f} ".format(cluster.weights[index]), Indent=False)
+				# Write weight for each the affected vertex. Quantized weights are in units of 1 / ((1 << bits) - 1).
+				if weight_bits:
+					self.exporter.file.Write('<weight quantize="{}">'.format(weight_bits))
+					self.exporter.file.Write(" ".join(map(str, cluster.weights.tolist())), Indent=False)
+				else:
+					self.exporter.file.Write('<weight>')
+					self.exporter.file.Write("".join("{:f}  ".format(weight) for weight in cluster.weights.tolist()), Indent=False)
 					
-					if index != group_vertex_count - 1:
-						self.exporter.file.Write(" ", Indent=False)
-
 				self.exporter.file.Write('</>\n', Indent=False)
 
 				self.exporter.file.Unindent()
 				self.exporter.file.Write('</influence>\n')
 			
+			if packed:
+				self.Skin_Packed_Write(xmesh, offsets, influences, weights, weight_bits)
+			
 			# TODO: Enable when modifier element has been added to xsg.
 			#self.exporter.file.Unindent()
 			#self.exporter.file.Write('</modifier>\n')
 								
  
+	def Morphs_Write(self, mesh, xmesh):
+	
+		# Write a morph target per non basis shape key, in shape key order so morph weight animation components map onto
+		# them - converting coordinate system. Only vertices moved further than the threshold are stored, as vertex
+		# indices & position offsets from the key's relative (usually basis) key.
+		
+		exp = self.exporter
+		key = self.blender_object.data.shape_keys
+		
+		if key is None or len(key.key_blocks) < 2:
+			return
+			
+		if not key.use_relative:
+			exp.Log("Morphs : {} has absolute shape keys, which aren't supported".format(self.name))
+			return
+		
+		vertex_count = len(mesh.vertices)
+		
+		if len(key.key_blocks[0].data) != vertex_count:
+			exp.Log("Morphs : {} vertex count changed by modifiers, shape keys not exported".format(self.name))
+			return
+		
+		coordinates = np.empty((len(key.key_blocks), vertex_count * 3), dtype=np.float32)
+		
+		for index, block in enumerate(key.key_blocks):
+			block.data.foreach_get("co", coordinates[index])
+			
+		coordinates = coordinates.reshape(len(key.key_blocks), -1, 3)[:, :, (0, 2, 1)]
+		
+		threshold = exp.config.morph_threshold
+		duplicates = xmesh.position_duplicates
+		stored = 0
+		
+		for index, block in enumerate(key.key_blocks):
+		
+			if index == 0:
+				continue
+				
+			indices, deltas = Morph_Deltas_Sparse(coordinates[key.key_blocks.find(block.relative_key.name)], coordinates[index], threshold)
+			
+			# Positions duplicated by bone palette splitting move with their source vertex.
+			if len(duplicates) > 0 and len(indices) > 0:
+				moved = np.flatnonzero(np.isin(duplicates, indices))
+				deltas = np.concatenate((deltas, deltas[np.searchsorted(indices, duplicates[moved])]))
+				indices = np.concatenate((indices, vertex_count + moved))
+				
+			stored += len(indices)
+			
+			morph_id = Util.SafeName(block.name)
+			
+			if len(indices) == 0:
+				exp.file.Write('<morph id="{}" vertices="0"/>\n'.format(morph_id))
+				continue
+				
+			exp.file.Write('<morph id="{}" vertices="{}">\n'.format(morph_id, len(indices)))
+			exp.file.Indent()
+			
+			xmesh.Index_Stream_Write(exp, "vertex", indices.tolist(), 1)
+			
+			if exp.config.quantize_attributes:
+				quantized, offset, scale, error = Quantize_Range(deltas, 16)
+				attributes = ' quantize="16" offset="{:.9g} {:.9g} {:.9g}" scale="{:.9g} {:.9g} {:.9g}"'.format(*offset, *scale)
+				
+				if exp.config.compress_streams:
+					xmesh.Attribute_Stream_Write(exp, "position", quantized.astype(np.uint16), attributes)
+				else:
+					exp.file.Write('<position{}>'.format(attributes))
+					exp.file.Write("".join("{} {} {}  ".format(*d) for d in quantized.tolist()), Indent=False)
+					exp.file.Write("</position>\n", Indent=False)
+			elif exp.config.compress_streams:
+				xmesh.Attribute_Stream_Write(exp, "position", deltas)
+			else:
+				exp.file.Write('<position>')
+				exp.file.Write("".join("{:f} {:f} {:f}  ".format(*d) for d in deltas.tolist()), Indent=False)
+				exp.file.Write("</position>\n", Indent=False)
+				
+			exp.file.Unindent()
+			exp.file.Write('</morph>\n')
+			
+		exp.Log("Morphs : {} shape keys, {} of {} vertex offsets stored".format(len(key.key_blocks) - 1, stored, (len(key.key_blocks) - 1) * vertex_count))
+		
+		
+	def Skin_Packed_Write(self, xmesh, offsets, influences, weights, weight_bits):
+	
+		# Per vertex skinning - size influence indices & weights for each vertex, strongest first & zero weight padded.
+		# Indices are relative to the vertex's bone palette when faces were split into palette batches, otherwise
+		# they index the influences in write order.
+		
+		exp = self.exporter
+		size = max(int(np.diff(offsets).max()) if len(offsets) > 1 else 0, 1)
+		
+		bones, weights = Skin_Weights_Pack(offsets, influences, weights, size)
+		
+		if xmesh.vertex_batches is not None:
+			bones = Skin_Palette_Slots(bones, xmesh.vertex_batches, xmesh.palettes)
+		
+		bones = bones.astype(np.uint8 if bones.size == 0 or bones.max() < 256 else np.uint16)
+		
+		if weight_bits:
+			weights = weights.astype(np.uint8 if weight_bits == 8 else np.uint16)
+			weight_attributes = ' quantize="{}"'.format(weight_bits)
+		else:
+			weights = weights.astype(np.float32)
+			weight_attributes = ""
+		
+		exp.file.Write('<skin size="{}">\n'.format(size))
+		exp.file.Indent()
+		
+		if exp.config.compress_streams:
+			xmesh.Attribute_Stream_Write(exp, "bone", bones)
+			xmesh.Attribute_Stream_Write(exp, "weight", weights, weight_attributes)
+		else:
+			integer_format = "{} " * size + " "
+			weight_format = integer_format if weight_bits else "{:f} " * size + " "
+			
+			exp.file.Write('<bone>')
+			exp.file.Write("".join(integer_format.format(*row) for row in bones.tolist()), Indent=False)
+			exp.file.Write('</bone>\n', Indent=False)
+			
+			exp.file.Write('<weight{}>'.format(weight_attributes))
+			exp.file.Write("".join(weight_format.format(*row) for row in weights.tolist()), Indent=False)
+			exp.file.Write('</weight>\n', Indent=False)
+			
+		exp.file.Unindent()
+		exp.file.Write('</skin>\n')
+		
+	
    # TODO: complete this.		
 	def Mesh_WriteVertexColours(self, mesh):
 		# If there are no vertex colors, don't write anything
@@ -0,0 +1,186 @@
+################################################################################################################################
+#
+# Copyright (c) 2023, Advance Software Limited. All rights reserved.
+#
+# Redistribution and use in source and binary forms with or without
+# modification are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL ADVANCE SOFTWARE LIMITED BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# This file : Vertex attribute quantization.
+#
+#             Positions & texture coordinates are stored as unsigned integers relative to their bounding range :
+#
+#                 value = offset + quantized * scale
+#
+#             Normals are octahedral encoded - the unit sphere is projected onto an octahedron, which is unfolded
+#             onto the [-1,1] square & stored as two unsigned integers per normal.
+#
+#             Quaternions are smallest three encoded - see Quaternion_Smallest_Three_Encode.
+#
+# ------------------------------------------------------------------------------------------------------------------------------
+
+import math
+import numpy as np
+
+
+# Quantize an (N, C) float array to unsigned integers of the requested bit depth across each component's range.
+# Returns (quantized, offset, scale, max_error) where max_error is the largest absolute component error.
+
+def Quantize_Range(values, bits):
+
+	values = np.asarray(values, dtype=np.float64)
+	levels = (1 << bits) - 1
+
+	if len(values) == 0:
+		components = values.shape[1] if values.ndim == 2 else 0
+		return np.zeros(values.shape, dtype=np.uint32), np.zeros(components), np.ones(components), 0.0
+
+	offset = values.min(axis=0)
+	extent = values.max(axis=0) - offset
+
+	# Flat components (e.g. a planar mesh) quantize to zero - any non zero scale dequantizes them exactly.
+	scale = np.where(extent > 0, extent / levels, 1.0)
+
+	quantized = np.rint((values - offset) / scale).astype(np.uint32)
+	error = float(np.abs(Dequantize_Range(quantized, offset, scale) - values).max())
+
+	return quantized, offset, scale, error
+
+
+def Dequantize_Range(quantized, offset, scale):
+	return offset + quantized * scale
+
+
+# Octahedral encode (N, 3) unit normals to (N, 2) unsigned integers with the requested bits per component.
+# Returns (encoded, max_error) where max_error is the largest angular error in degrees.
+
+def Octahedral_Encode(normals, bits):
+
+	normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+	levels = (1 << bits) - 1
+
+	if len(normals) == 0:
+		return np.zeros((0, 2), dtype=np.uint32), 0.0
+
+	# Project onto the octahedron |x| + |y| + |z| = 1
+	l1 = np.abs(normals).sum(axis=1, keepdims=True)
+	p = normals / np.where(l1 > 0, l1, 1.0)
+
+	x = p[:, 0]
+	y = p[:, 1]
+	sign_x = np.where(x >= 0, 1.0, -1.0)
+	sign_y = np.where(y >= 0, 1.0, -1.0)
+
+	# Fold the lower hemisphere over the diagonals.
+	lower = p[:, 2] < 0
+	ox = np.where(lower, (1.0 - np.abs(y)) * sign_x, x)
+	oy = np.where(lower, (1.0 - np.abs(x)) * sign_y, y)
+
+	encoded = np.rint((np.stack((ox, oy), axis=1) * 0.5 + 0.5) * levels).astype(np.uint32)
+
+	# Report error against the normalized source as Blender normals carry small length drift.
+	lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+	source = normals / np.where(lengths > 0, lengths, 1.0)
+	cosine = np.clip((Octahedral_Decode(encoded, bits) * source).sum(axis=1), -1.0, 1.0)
+	error = math.degrees(float(np.arccos(cosine).max()))
+
+	return encoded, error
+
+
+def Octahedral_Decode(encoded, bits):
+
+	levels = (1 << bits) - 1
+	o = np.asarray(encoded, dtype=np.float64) / levels * 2.0 - 1.0
+
+	x = o[:, 0]
+	y = o[:, 1]
+	z = 1.0 - np.abs(x) - np.abs(y)
+
+	# Unfold the lower hemisphere.
+	t = np.clip(-z, 0.0, None)
+	x = x - np.where(x >= 0, t, -t)
+	y = y - np.where(y >= 0, t, -t)
+
+	n = np.stack((x, y, z), axis=1)
+	return n / np.linalg.norm(n, axis=1, keepdims=True)
+
+
+# Smallest three quaternion encoding. The largest magnitude component is dropped & rebuilt from the unit length constraint,
+# so the other three lie in [-1/sqrt(2), 1/sqrt(2)] & are quantized to bits (at most 15) each. q & -q are the same rotation,
+# so the dropped component is made positive. The result is (N, 3) uint16 - the dropped component's index is stored in the
+# top bits of the first two values.
+# Returns (encoded, max_error) where max_error is the largest angular error in degrees.
+
+def Quaternion_Smallest_Three_Encode(quaternions, bits=15):
+
+	q = np.asarray(quaternions, dtype=np.float64).reshape(-1, 4)
+	levels = (1 << bits) - 1
+
+	if len(q) == 0:
+		return np.zeros((0, 3), dtype=np.uint16), 0.0
+
+	q = q / np.linalg.norm(q, axis=1, keepdims=True)
+
+	largest = np.argmax(np.abs(q), axis=1)
+	q = np.where(np.take_along_axis(q, largest[:, np.newaxis], axis=1) < 0, -q, q)
+
+	small = np.take_along_axis(q, Smallest_Three_Components(largest), axis=1)
+	quantized = np.clip(np.rint((small * math.sqrt(0.5) + 0.5) * levels), 0, levels).astype(np.uint16)
+
+	quantized[:, 0] |= ((largest >> 1) << 15).astype(np.uint16)
+	quantized[:, 1] |= ((largest & 1) << 15).astype(np.uint16)
+
+	cosine = np.clip(np.abs((Quaternion_Smallest_Three_Decode(quantized, bits) * q).sum(axis=1)), 0.0, 1.0)
+	error = math.degrees(float(2.0 * np.arccos(cosine).max()))
+
+	return quantized, error
+
+
+def Quaternion_Smallest_Three_Decode(encoded, bits=15):
+
+	encoded = np.asarray(encoded, dtype=np.uint16).reshape(-1, 3)
+	levels = (1 << bits) - 1
+
+	largest = ((encoded[:, 0] >> 15) << 1 | (encoded[:, 1] >> 15)).astype(np.int64)
+	small = ((encoded & 0x7FFF) / levels - 0.5) * math.sqrt(2.0)
+
+	q = np.empty((len(encoded), 4))
+	np.put_along_axis(q, Smallest_Three_Components(largest), small, axis=1)
+	np.put_along_axis(q, largest[:, np.newaxis], np.sqrt(np.clip(1.0 - (small * small).sum(axis=1), 0.0, None))[:, np.newaxis], axis=1)
+
+	return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+# Indices of the three components stored when the component at largest is dropped, in ascending order.
+def Smallest_Three_Components(largest):
+	components = np.arange(1, 4) + np.zeros((len(largest), 1), dtype=np.int64)
+	return components - (components <= largest[:, np.newaxis])
+
+
+# Collapse duplicate rows of a quantized table, returning the unique rows & an old index -> new index remap.
+# Attributes which differed only by less than the quantization step become shared entries.
+
+def Quantized_Remove_Duplicates(quantized):
+
+	if len(quantized) == 0:
+		return quantized, np.zeros(0, dtype=np.int64)
+
+	unique, remap = np.unique(quantized, axis=0, return_inverse=True)
+	return unique, remap.reshape(-1)
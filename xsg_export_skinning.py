@@ -0,0 +1,247 @@
+################################################################################################################################
+#
+# Copyright (c) 2023, Advance Software Limited. All rights reserved.
+#
+# Redistribution and use in source and binary forms with or without
+# modification are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL ADVANCE SOFTWARE LIMITED BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# This file : Skin weight processing - pure NumPy, no Blender dependencies.
+#
+#             Vertex influences are held in compressed sparse row (CSR) form :
+#
+#                 offsets    : (V + 1) - vertex v's influences are entries offsets[v] to offsets[v+1]
+#                 influences : (E)     - influence (bone) index of each entry
+#                 weights    : (E)     - weight of each entry
+#
+# ------------------------------------------------------------------------------------------------------------------------------
+
+import numpy as np
+
+
+# Build CSR offsets from per vertex entry counts.
+
+def Skin_Offsets(counts):
+	offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+	np.cumsum(counts, out=offsets[1:])
+	return offsets
+
+
+# Vertex index of each CSR entry.
+
+def Skin_Entry_Vertices(offsets):
+	return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+# Map vertex group memberships onto influences. group_to_influence gives the influence index of each vertex group, or -1
+# where the group isn't an influence (e.g. a group used for a modifier). Those entries are dropped.
+# Returns (offsets, influences, weights).
+
+def Skin_Weights_Filter(offsets, groups, weights, group_to_influence):
+
+	group_to_influence = np.asarray(group_to_influence, dtype=np.int64)
+	groups = np.asarray(groups, dtype=np.int64)
+
+	if len(groups) == 0 or len(group_to_influence) == 0:
+		return np.zeros(len(offsets), dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+	# Guard against stale group indices.
+	valid = (groups >= 0) & (groups < len(group_to_influence))
+	influences = np.full(len(groups), -1, dtype=np.int64)
+	influences[valid] = group_to_influence[groups[valid]]
+
+	keep = influences >= 0
+	counts = np.bincount(Skin_Entry_Vertices(offsets)[keep], minlength=len(offsets) - 1)
+
+	return Skin_Offsets(counts), influences[keep], np.asarray(weights, dtype=np.float64)[keep]
+
+
+# Scale each vertex's weights to sum to one. Vertices whose weights sum to zero are left unchanged.
+
+def Skin_Weights_Normalize(offsets, weights):
+
+	vertices = Skin_Entry_Vertices(offsets)
+	totals = np.bincount(vertices, weights=weights, minlength=len(offsets) - 1)
+	totals = np.where(totals > 0, totals, 1.0)
+
+	return weights / totals[vertices]
+
+
+# Transpose CSR vertex influences into per influence vertex lists.
+# Returns (vertices, weights, starts) - influence i affects vertices[starts[i]:starts[i+1]], in ascending vertex order.
+
+def Skin_Influence_Vertices(offsets, influences, weights, influence_count):
+
+	# Stable sort keeps each influence's vertices in CSR (ascending vertex) order.
+	order = np.argsort(influences, kind='stable')
+	starts = Skin_Offsets(np.bincount(influences, minlength=influence_count))
+
+	return Skin_Entry_Vertices(offsets)[order], weights[order], starts
+
+
+# Rank of each entry among its vertex's entries by descending weight - 0 for the strongest. Ties keep CSR order.
+
+def Skin_Entry_Ranks(offsets, weights):
+
+	vertices = Skin_Entry_Vertices(offsets)
+	order = np.lexsort((-weights, vertices))
+
+	ranks = np.empty(len(weights), dtype=np.int64)
+	ranks[order] = np.arange(len(weights)) - offsets[vertices[order]]
+	return ranks
+
+
+# Keep each vertex's max_influences strongest entries, in their original order. Weights are not renormalized.
+# Returns (offsets, influences, weights).
+
+def Skin_Weights_Limit(offsets, influences, weights, max_influences):
+
+	keep = Skin_Entry_Ranks(offsets, weights) < max_influences
+	counts = np.bincount(Skin_Entry_Vertices(offsets)[keep], minlength=len(offsets) - 1)
+
+	return Skin_Offsets(counts), influences[keep], weights[keep]
+
+
+# Quantize normalized weights to unsigned integers of the requested bit depth, such that each vertex's weights sum to
+# exactly (1 << bits) - 1. Rounding shortfall goes to the entries with the largest fractional parts.
+# Returns (quantized, max_error) where max_error is the largest absolute weight error.
+
+def Skin_Weights_Quantize(offsets, weights, bits):
+
+	levels = (1 << bits) - 1
+
+	if len(weights) == 0:
+		return np.zeros(0, dtype=np.uint32), 0.0
+
+	vertices = Skin_Entry_Vertices(offsets)
+	scaled = weights * levels
+	quantized = np.floor(scaled)
+	fraction = scaled - quantized
+
+	totals = np.bincount(vertices, weights=weights, minlength=len(offsets) - 1)
+	shortfall = np.where(totals > 0, levels - np.bincount(vertices, weights=quantized, minlength=len(offsets) - 1), 0)
+
+	quantized += Skin_Entry_Ranks(offsets, fraction) < np.rint(shortfall[vertices])
+
+	error = float(np.abs(quantized / levels - weights).max())
+
+	return quantized.astype(np.uint32), error
+
+
+# Append copies of the rows of the source vertices, for vertices duplicated after skinning was gathered.
+# Returns (offsets, influences, weights).
+
+def Skin_Vertices_Duplicate(offsets, influences, weights, sources):
+
+	sources = np.asarray(sources, dtype=np.int64)
+
+	if len(sources) == 0:
+		return offsets, influences, weights
+
+	counts = np.diff(offsets)[sources]
+	copy_offsets = Skin_Offsets(counts)
+	copies = np.repeat(offsets[sources] - copy_offsets[:-1], counts) + np.arange(copy_offsets[-1])
+
+	return Skin_Offsets(np.concatenate((np.diff(offsets), counts))), np.concatenate((influences, influences[copies])), np.concatenate((weights, weights[copies]))
+
+
+# Partition faces into batches whose influences fit a bone palette of palette_size entries, as needed for GPU skinning.
+# Faces are taken in order & a new batch is started when the next face's influences no longer fit, which keeps batches
+# spatially coherent for typical meshes. A face with more influences than the palette holds gets a batch to itself.
+# faces is an (F, size) array of vertex indices.
+# Returns (batches, palettes, oversized) - the batch of each face, each batch's ascending influence indices & the number
+# of faces which overflow the palette on their own.
+
+def Skin_Palettes_Partition(faces, offsets, influences, palette_size):
+
+	vertex_influences = [row.tolist() for row in np.split(influences, offsets[1:-1])]
+
+	batches = np.empty(len(faces), dtype=np.int64)
+	palettes = []
+	palette = set()
+	oversized = 0
+
+	for face, vertices in enumerate(np.asarray(faces).tolist()):
+		bones = set()
+
+		for vertex in vertices:
+			bones.update(vertex_influences[vertex])
+
+		if len(bones) > palette_size:
+			oversized += 1
+
+		merged = palette | bones
+
+		if len(merged) > palette_size and len(palette) > 0:
+			palettes.append(palette)
+			palette = bones
+		else:
+			palette = merged
+
+		batches[face] = len(palettes)
+
+	palettes.append(palette)
+
+	return batches, [np.array(sorted(palette), dtype=np.int64) for palette in palettes], oversized
+
+
+# Pack CSR influences into fixed width per vertex arrays, strongest first, padding unused slots with influence 0 at
+# weight 0. These map directly onto GPU vertex attributes.
+# Returns (influences, weights), both (V, width).
+
+def Skin_Weights_Pack(offsets, influences, weights, width):
+
+	vertex_count = len(offsets) - 1
+	packed_influences = np.zeros((vertex_count, width), dtype=np.int64)
+	packed_weights = np.zeros((vertex_count, width), dtype=weights.dtype)
+
+	ranks = Skin_Entry_Ranks(offsets, weights)
+	keep = ranks < width
+	vertices = Skin_Entry_Vertices(offsets)[keep]
+
+	packed_influences[vertices, ranks[keep]] = influences[keep]
+	packed_weights[vertices, ranks[keep]] = weights[keep]
+
+	return packed_influences, packed_weights
+
+
+# Convert influence indices to palette slots. palettes holds each batch's ascending influence indices & vertex_batches
+# the batch of each vertex, or -1 for vertices in no batch, which keep their influence indices. Influences missing from
+# their vertex's palette - only the zero weight padding of Skin_Weights_Pack - become slot 0.
+
+def Skin_Palette_Slots(influences, vertex_batches, palettes):
+
+	starts = Skin_Offsets([len(palette) for palette in palettes])
+
+	if starts[-1] == 0 or influences.size == 0:
+		return influences
+
+	# Search all palettes at once, keyed by batch * stride + influence.
+	stride = int(max(influences.max(), max(palette.max() for palette in palettes if len(palette) > 0))) + 1
+	keys = np.concatenate([palette + batch * stride for batch, palette in enumerate(palettes)])
+
+	batches = np.broadcast_to(vertex_batches[:, np.newaxis], influences.shape)
+	queries = influences + batches * stride
+	positions = np.searchsorted(keys, queries)
+	found = keys[np.minimum(positions, len(keys) - 1)] == queries
+
+	slots = np.where(found, positions - starts[np.maximum(batches, 0)], 0)
+
+	return np.where(batches >= 0, slots, influences)